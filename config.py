@@ -57,6 +57,22 @@ class Config:
         int
     ] = None  # Eval and Test should break after this many iterations (not epochs!) None runs whole test and val
     neo4j: bool = False  # Should the dataset use neo4j database or not
+    neo4j_backend: str = "server"  # "server": a running neo4j instance, "memory": the same queries answered in-process from the split graphs (no server needed)
+    batched_sampling: bool = False  # Sample the subgraph of a whole batch in one vectorized pass instead of one customer at a time (neo4j: one query per batch)
+    negative_sampling: str = "uniform"  # "uniform" or "degree": draw training negatives proportional to article degree^negative_sampling_alpha
+    negative_sampling_alpha: float = 0.75
+    eval_snapshots: bool = False  # Sample the val/test subgraphs once, freeze them to data/derived/snapshots and serve them from there
+    prefetch_factor: int = 2  # batches loaded in advance by each worker (only used if num_workers > 0)
+    persistent_workers: bool = True  # keep the workers (and their neo4j drivers) alive between epochs
+    neo4j_pool_size: int = 4  # long-lived sessions (and connections) per neo4j driver
+    neo4j_fetch_size: int = 1000  # records pulled from neo4j per round trip
+    neo4j_prefetch: int = 0  # batches of neighborhood queries kept in flight on the async neo4j driver while training, 0 turns it off
+    neighborhood_cache_entries: int = 0  # neo4j neighborhoods kept in an LRU cache (shared by the workers), 0 turns it off. Training only caches them without num_neighbors sampling
+    neighborhood_cache_bytes: int = 2**30  # upper bound of the memory used by the cached neighborhoods
+    batching: str = "random"  # "random": batch_size random customers, "degree_buckets": batch_size customers of similar estimated subgraph size, "edge_budget": as many customers as fit in batch_max_edges / batch_max_nodes
+    degree_buckets: int = 10  # number of subgraph size buckets of "degree_buckets" batching
+    batch_max_edges: int = 200_000  # budget of estimated subgraph edges per batch of "edge_budget" batching
+    batch_max_nodes: Optional[int] = None  # budget of estimated subgraph nodes per batch of "edge_budget" batching, None: no node budget
 
     def print(self):
         print("\nConfiguration is:")
@@ -72,6 +88,19 @@ class Config:
         assert (
             self.p_dropout_features <= 1.0
         ), "p_dropout_features cannot be bigger than 1.0"
+        assert self.negative_sampling in [
+            "uniform",
+            "degree",
+        ], "negative_sampling has to be 'uniform' or 'degree'"
+        assert self.neo4j_backend in [
+            "server",
+            "memory",
+        ], "neo4j_backend has to be 'server' or 'memory'"
+        assert self.batching in [
+            "random",
+            "degree_buckets",
+            "edge_budget",
+        ], "batching has to be 'random', 'degree_buckets' or 'edge_budget'"
 
 
 @dataclass
@@ -173,5 +202,6 @@ preprocessing_config = PreprocessingConfig(
     text_embedding_colname="derived_look",
     data_size=10_000,
     save_to_neo4j=True,
+    compress_neo4j_csv=False,
     data_type=DataType.pyg,
 )
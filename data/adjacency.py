@@ -0,0 +1,131 @@
+import torch as t
+import numpy as np
+from torch import Tensor
+from typing import Optional
+import itertools
+
+
+class CSRAdjacency:
+    """
+    Compressed sparse row index of a bipartite adjacency (eg.: customer -> article).
+    The neighbours of row `i` are `indices[indptr[i]:indptr[i + 1]]`, sorted in ascending order.
+    """
+
+    def __init__(self, indptr: Tensor, indices: Tensor, num_cols: Optional[int] = None):
+        self.indptr = indptr
+        self.indices = indices
+        self.max_degree = (
+            int((indptr[1:] - indptr[:-1]).max()) if indptr.shape[0] > 1 else 0
+        )
+        self.num_cols = (
+            num_cols
+            if num_cols is not None
+            else (int(indices.max()) + 1 if indices.numel() > 0 else 0)
+        )
+
+    @staticmethod
+    def from_dict(adjacency: dict, num_rows: Optional[int] = None) -> "CSRAdjacency":
+        """Build the index from the `edges_*.pt` / `rev_edges_*.pt` dict of lists"""
+        rows = np.fromiter(adjacency.keys(), dtype=np.int64, count=len(adjacency))
+        counts = np.fromiter(
+            (len(neighbours) for neighbours in adjacency.values()),
+            dtype=np.int64,
+            count=len(adjacency),
+        )
+        cols = np.fromiter(
+            itertools.chain.from_iterable(adjacency.values()),
+            dtype=np.int64,
+            count=int(counts.sum()),
+        )
+        return CSRAdjacency.from_edge_index(
+            t.from_numpy(np.stack([np.repeat(rows, counts), cols])),
+            num_rows=num_rows,
+        )
+
+    @staticmethod
+    def from_edge_index(
+        edge_index: Tensor,
+        num_rows: Optional[int] = None,
+        num_cols: Optional[int] = None,
+    ) -> "CSRAdjacency":
+        """Build the index from a [2, num_edges] edge index, rows are taken from edge_index[0]"""
+        rows, cols = edge_index[0].to(t.long), edge_index[1].to(t.long)
+        if num_rows is None:
+            num_rows = int(rows.max()) + 1 if rows.numel() > 0 else 0
+
+        # Sort by (row, col) so that every row slice is sorted as well
+        order = t.from_numpy(np.lexsort((cols.numpy(), rows.numpy())))
+        counts = t.bincount(rows, minlength=num_rows)
+        indptr = t.zeros(num_rows + 1, dtype=t.long)
+        t.cumsum(counts, dim=0, out=indptr[1:])
+
+        assert cols.numel() == 0 or cols.max() < 2**31, "Column ids must fit in int32"
+        return CSRAdjacency(indptr, cols[order].to(t.int32), num_cols)
+
+    @property
+    def num_rows(self) -> int:
+        return self.indptr.shape[0] - 1
+
+    @property
+    def num_edges(self) -> int:
+        return self.indices.shape[0]
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __getitem__(self, row: int) -> Tensor:
+        return self.indices[self.indptr[row] : self.indptr[row + 1]].to(t.long)
+
+    def degree(self, rows: Optional[Tensor] = None) -> Tensor:
+        degrees = self.indptr[1:] - self.indptr[:-1]
+        return degrees if rows is None else degrees[rows]
+
+    def neighbours(self, rows: Tensor) -> Tensor:
+        """Concatenated neighbours of all `rows`, in the order of `rows`"""
+        return self.indices[self.__positions(rows)].to(t.long)
+
+    def edges(self, rows: Tensor) -> Tensor:
+        """Edges [2, num_edges] going out of all `rows`"""
+        positions = self.__positions(rows)
+        return t.stack(
+            [
+                t.repeat_interleave(rows.to(t.long), self.degree(rows)),
+                self.indices[positions].to(t.long),
+            ],
+            dim=0,
+        )
+
+    def contains(self, rows: Tensor, cols: Tensor) -> Tensor:
+        """Mask of which (rows[i], cols[i]) pairs are edges, binary searching inside every row slice"""
+        rows, cols = rows.to(t.long), cols.to(self.indices.dtype)
+        row_ends = self.indptr[rows + 1]
+        low, high = self.indptr[rows], row_ends
+        last_position = max(self.num_edges - 1, 0)
+        for _ in range(self.max_degree.bit_length()):
+            searching = low < high
+            middle = (low + high) // 2
+            go_right = searching & (
+                self.indices[middle.clamp(max=last_position)] < cols
+            )
+            low = t.where(go_right, middle + 1, low)
+            high = t.where(searching & ~go_right, middle, high)
+
+        if self.num_edges == 0:
+            return t.zeros_like(rows, dtype=t.bool)
+        return (low < row_ends) & (self.indices[low.clamp(max=last_position)] == cols)
+
+    def share_memory_(self) -> "CSRAdjacency":
+        self.indptr.share_memory_()
+        self.indices.share_memory_()
+        return self
+
+    def __positions(self, rows: Tensor) -> Tensor:
+        """Positions in `indices` of the slices belonging to `rows`"""
+        rows = rows.to(t.long)
+        starts = self.indptr[rows]
+        counts = self.indptr[rows + 1] - starts
+        # Each position is: start of its row + offset inside the row
+        row_offsets = t.cumsum(counts, dim=0) - counts
+        return t.arange(int(counts.sum())) + t.repeat_interleave(
+            starts - row_offsets, counts
+        )
@@ -0,0 +1,38 @@
+import torch as t
+from torch.utils.data import DataLoader, Dataset
+from torch_geometric.data import HeteroData
+from typing import List
+
+
+class BatchSamplingLoader(DataLoader):
+    """
+    Loader that hands whole batches of customer ids to `dataset.sample_batch`,
+    instead of building and collating one subgraph per customer.
+    """
+
+    def __init__(self, dataset, **kwargs):
+        self.graph_dataset = dataset
+        super().__init__(
+            CustomerIds(dataset), collate_fn=BatchCollater(dataset), **kwargs
+        )
+
+
+class CustomerIds(Dataset):
+    """Index-only view of a graph dataset, the sampling happens in BatchCollater"""
+
+    def __init__(self, graph_dataset):
+        self.graph_dataset = graph_dataset
+
+    def __len__(self) -> int:
+        return len(self.graph_dataset)
+
+    def __getitem__(self, idx: int) -> int:
+        return idx
+
+
+class BatchCollater:
+    def __init__(self, graph_dataset):
+        self.graph_dataset = graph_dataset
+
+    def __call__(self, indices: List[int]) -> HeteroData:
+        return self.graph_dataset.sample_batch(t.tensor(indices, dtype=t.long))
@@ -0,0 +1,220 @@
+import math
+import torch as t
+from torch import Tensor
+from torch.utils.data import Sampler
+from typing import Iterator, List, Optional, Tuple
+from config import Config
+from .adjacency import CSRAdjacency
+from .dataset import GraphDataset
+
+
+class DegreeBucketBatchSampler(Sampler):
+    """
+    Batches of customers with similar (estimated) subgraph sizes: the customers are sorted by size into
+    num_buckets equally sized buckets, batches are cut from a shuffled bucket and the batches are shuffled.
+    A heavy buyer ends up in a batch of heavy buyers, instead of padding the candidates of a batch of light ones.
+    """
+
+    def __init__(
+        self,
+        sizes: Tensor,
+        batch_size: int,
+        num_buckets: int = 10,
+        shuffle: bool = True,
+    ):
+        self.sizes = sizes
+        self.batch_size = batch_size
+        self.num_buckets = num_buckets
+        self.shuffle = shuffle
+
+    def __len__(self) -> int:
+        return sum(
+            math.ceil(len(bucket) / self.batch_size) for bucket in self.__buckets()
+        )
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = [
+            batch
+            for bucket in self.__buckets()
+            for batch in (
+                bucket[t.randperm(len(bucket))] if self.shuffle else bucket
+            ).split(self.batch_size)
+        ]
+        order = t.randperm(len(batches)) if self.shuffle else t.arange(len(batches))
+        for i in order.tolist():
+            yield batches[i].tolist()
+
+    def __buckets(self) -> List[Tensor]:
+        # The random permutation breaks the ties, customers of the same size don't always share a bucket
+        permutation = (
+            t.randperm(self.sizes.shape[0])
+            if self.shuffle
+            else t.arange(self.sizes.shape[0])
+        )
+        by_size = permutation[t.sort(self.sizes[permutation], stable=True)[1]]
+        return [
+            bucket
+            for bucket in by_size.tensor_split(self.num_buckets)
+            if bucket.numel() > 0
+        ]
+
+
+class EdgeBudgetBatchSampler(Sampler):
+    """
+    Batches of as many customers as fit in a budget of (estimated) subgraph edges and nodes, instead of a fixed batch_size.
+    A customer that is over the budget on its own is a batch on its own.
+    """
+
+    def __init__(
+        self,
+        edges: Tensor,
+        nodes: Tensor,
+        max_edges: int,
+        max_nodes: Optional[int] = None,
+        shuffle: bool = True,
+    ):
+        self.edges = edges
+        self.nodes = nodes
+        self.max_edges = max_edges
+        self.max_nodes = max_nodes if max_nodes is not None else float("inf")
+        self.shuffle = shuffle
+        # The packing of the next epoch, made ahead of time so __len__ counts the batches __iter__ yields
+        self.next_batches: Optional[List[List[int]]] = None
+
+    def __len__(self) -> int:
+        return len(self.__next_batches())
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = self.__next_batches()
+        self.next_batches = None
+        return iter(batches)
+
+    def __next_batches(self) -> List[List[int]]:
+        if self.next_batches is None:
+            order = (
+                t.randperm(self.edges.shape[0])
+                if self.shuffle
+                else t.arange(self.edges.shape[0])
+            )
+            self.next_batches = self.__pack(order)
+        return self.next_batches
+
+    def __pack(self, order: Tensor) -> List[List[int]]:
+        """Greedily fills the batches in the given order"""
+        batches, batch, num_edges, num_nodes = [], [], 0.0, 0.0
+        for idx, edges, nodes in zip(
+            order.tolist(), self.edges[order].tolist(), self.nodes[order].tolist()
+        ):
+            if len(batch) > 0 and (
+                num_edges + edges > self.max_edges or num_nodes + nodes > self.max_nodes
+            ):
+                batches.append(batch)
+                batch, num_edges, num_nodes = [], 0.0, 0.0
+            batch.append(idx)
+            num_edges += edges
+            num_nodes += nodes
+        if len(batch) > 0:
+            batches.append(batch)
+        return batches
+
+
+def estimate_subgraph_sizes(
+    users: CSRAdjacency,
+    articles: CSRAdjacency,
+    num_neighbors: int,
+    n_hop_neighbors: int,
+    per_node: bool = False,
+) -> Tuple[Tensor, Tensor]:
+    """
+    Estimated number of edges and nodes of the subgraph of every customer: its own purchases (the label edges)
+    and the sampled neighbourhood, num_neighbors capped (-1 takes all neighbors) the way the dataset's sampler caps it.
+    per_node=False: fetch_n_hop_neighbourhood, a hop is customer -> article -> customer and every hop keeps at most
+    num_neighbors articles and num_neighbors customers in total, the customers of all but the last hop are expanded.
+    per_node=True: the neo4j fan-out, a hop is one relationship and every frontier node keeps num_neighbors of them,
+    the relationships of the first hop (the customer's own purchases) are not part of the neighbourhood.
+    The second hop uses the mean degree of the customer's own articles, further hops the mean degree of the graph,
+    and the nodes a hop reaches are counted as distinct uniform draws.
+    """
+    cap = float("inf") if num_neighbors < 0 else float(num_neighbors)
+    user_degree = users.degree().to(t.float)
+    article_degree = articles.degree().to(t.float)
+
+    """ Mean degree of the articles bought by each customer """
+    rows = t.repeat_interleave(t.arange(users.num_rows), users.degree())
+    article_degree_sum = t.zeros(users.num_rows).index_add_(
+        0, rows, article_degree[users.indices]
+    )
+    own_article_degree = article_degree_sum / user_degree.clamp(min=1)
+    # Customers and articles further away are drawn from the distinct nodes a hop reaches, mean degree of the graph
+    mean_user_degree = user_degree[user_degree > 0].mean().nan_to_num(0.0)
+    mean_article_degree = article_degree[article_degree > 0].mean().nan_to_num(0.0)
+    # The customer (or article) the hop comes from is not a new neighbour
+    other_customers = (own_article_degree - 1).clamp(min=0)
+    other_reached_customers = (mean_article_degree - 1).clamp(min=0)
+    other_reached_articles = (mean_user_degree - 1).clamp(min=0)
+
+    if per_node:
+        # Relationships are sampled per frontier node, the next frontier is the distinct nodes they reach
+        frontier = user_degree.clamp(max=cap)
+        neighbourhood = t.zeros_like(user_degree)
+        nodes = 1 + frontier
+        for hop in range(2, n_hop_neighbors + 1):
+            if hop == 2:
+                degree, num_nodes = other_customers, users.num_rows
+            elif hop % 2 == 1:
+                degree, num_nodes = other_reached_articles, articles.num_rows
+            else:
+                degree, num_nodes = other_reached_customers, users.num_rows
+            relationships = frontier * degree.clamp(max=cap)
+            neighbourhood = neighbourhood + relationships
+            frontier = distinct(relationships, num_nodes)
+            nodes = nodes + frontier
+        return user_degree + neighbourhood, nodes
+
+    # Every hop keeps at most cap of the distinct customers reached, all of them are expanded but the last ones
+    queue = distinct(
+        user_degree.clamp(max=cap) * other_customers, users.num_rows
+    ).clamp(max=cap)
+    expanded = t.zeros_like(user_degree)
+    for _ in range(1, n_hop_neighbors):
+        expanded = expanded + queue
+        queue = distinct(
+            (queue * mean_user_degree).clamp(max=cap) * other_reached_customers,
+            users.num_rows,
+        ).clamp(max=cap)
+    edges = user_degree + expanded * mean_user_degree
+    # Every edge can bring a new article
+    return edges, 1 + expanded + distinct(edges, articles.num_rows)
+
+
+def distinct(draws: Tensor, num_nodes: int) -> Tensor:
+    """Expected number of distinct nodes among `draws` uniform draws of num_nodes nodes"""
+    if num_nodes == 0:
+        return t.zeros_like(draws)
+    return num_nodes * -t.expm1(-draws / num_nodes)
+
+
+def create_batch_sampler(
+    dataset, config: Config, shuffle: bool = True
+) -> Optional[Sampler]:
+    """The batch sampler of config.batching, None for random batches of batch_size customers"""
+    if config.batching == "random":
+        return None
+
+    edges, nodes = estimate_subgraph_sizes(
+        dataset.users,
+        dataset.articles,
+        config.num_neighbors,
+        config.n_hop_neighbors,
+        # The neo4j datasets (server or in-memory backend) cap the fan-out per node
+        per_node=not isinstance(dataset, GraphDataset),
+    )
+    if config.batching == "degree_buckets":
+        return DegreeBucketBatchSampler(
+            edges, config.batch_size, config.degree_buckets, shuffle
+        )
+    if config.batching == "edge_budget":
+        return EdgeBudgetBatchSampler(
+            edges, nodes, config.batch_max_edges, config.batch_max_nodes, shuffle
+        )
+    raise ValueError(f"Unknown batching: {config.batching}")
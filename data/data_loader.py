@@ -2,69 +2,232 @@ from torch_geometric.data import HeteroData
 from config import Config
 from data.types import ArticleIdMap, CustomerIdMap
 import torch as t
-import json
-from typing import Tuple
+import numpy as np
+import random
+import time
+from functools import cached_property
+from typing import Iterator, Optional, Tuple, Union
+from torch.utils.data import get_worker_info
 import torch_geometric.transforms as T
 from torch_geometric.loader import NeighborLoader, LinkNeighborLoader, DataLoader
 from .dataset import GraphDataset
+from .id_map import IdMap
 from .dataset_neo import GraphDataset as GraphDatasetNeo
+from .batch_loader import BatchSamplingLoader
+from .neo4j.prefetch import AsyncPrefetchLoader
+from .snapshot import SnapshotDataset, materialize_snapshot
+from .batch_sampler import create_batch_sampler
 from .matching import get_matchers
 
 
 def create_dataloaders(
-    config: Config,
-) -> Tuple[DataLoader, DataLoader, DataLoader, CustomerIdMap, ArticleIdMap, HeteroData]:
-    Dataset = GraphDatasetNeo if config.neo4j else GraphDataset
-
-    data_dir = "data/derived/"
-    train_dataset = Dataset(
-        config=config,
-        graph_path=data_dir + "train_graph.pt",
-        users_adj_list=data_dir + "edges_train.pt",
-        articles_adj_list=data_dir + "rev_edges_train.pt",
-        train=True,
-        split_type="train",
-    )
+    config: Config, data_dir: str = "data/derived/"
+) -> "DataLoaders":
+    return DataLoaders(config, data_dir)
 
-    val_dataset = Dataset(
-        config=config,
-        graph_path=data_dir + "val_graph.pt",
-        users_adj_list=data_dir + "edges_val.pt",
-        articles_adj_list=data_dir + "rev_edges_val.pt",
-        train=False,
-        split_type="val",
-        matchers=get_matchers(config.matchers, "val", config.candidate_pool_size),
-    )
-    test_dataset = Dataset(
-        config=config,
-        graph_path=data_dir + "test_graph.pt",
-        users_adj_list=data_dir + "edges_test.pt",
-        articles_adj_list=data_dir + "rev_edges_test.pt",
-        train=False,
-        split_type="test",
-        matchers=get_matchers(config.matchers, "test", config.candidate_pool_size),
-    )
 
-    train_loader = DataLoader(train_dataset, batch_size=config.batch_size, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=config.batch_size, shuffle=True)
-    test_loader = DataLoader(test_dataset, batch_size=config.batch_size, shuffle=True)
+class DataLoaders:
+    """
+    The loaders and artifacts of a run, each one is loaded on first access
+    (eg.: a submission run never loads the train and val graphs).
+    Unpacks like the tuple create_dataloaders used to return:
+    train_loader, val_loader, test_loader, customer_id_map, article_id_map, data.
+    """
+
+    def __init__(self, config: Config, data_dir: str = "data/derived/"):
+        self.config = config
+        self.data_dir = data_dir
+        self.created_at = time.perf_counter()
+
+    def __iter__(self) -> Iterator:
+        return iter(
+            (
+                self.train_loader,
+                self.val_loader,
+                self.test_loader,
+                self.customer_id_map,
+                self.article_id_map,
+                self.data,
+            )
+        )
+
+    """ DATASETS """
+
+    @cached_property
+    def train_dataset(self) -> Union[GraphDataset, GraphDatasetNeo]:
+        return self.__create_dataset("train", train=True)
+
+    @cached_property
+    def val_dataset(self) -> Union[GraphDataset, GraphDatasetNeo]:
+        return self.__eval_dataset("val")
+
+    @cached_property
+    def test_dataset(self) -> Union[GraphDataset, GraphDatasetNeo]:
+        return self.__eval_dataset("test")
+
+    """ LOADERS """
+
+    @cached_property
+    def train_loader(self) -> DataLoader:
+        Loader, loader_args = self.__loader_class()
+        return self.__create_loader(Loader, self.train_dataset, loader_args, "train")
+
+    @cached_property
+    def val_loader(self) -> DataLoader:
+        EvalLoader, eval_args = self.__eval_loader_class()
+        return self.__create_loader(EvalLoader, self.val_dataset, eval_args, "val")
+
+    @cached_property
+    def test_loader(self) -> DataLoader:
+        EvalLoader, eval_args = self.__eval_loader_class()
+        return self.__create_loader(EvalLoader, self.test_dataset, eval_args, "test")
+
+    """ ARTIFACTS """
+
+    @cached_property
+    def customer_id_map(self) -> CustomerIdMap:
+        return IdMap.load(self.data_dir + "customer_id_map.npy")
+
+    @cached_property
+    def article_id_map(self) -> ArticleIdMap:
+        return IdMap.load(self.data_dir + "article_id_map.npy")
 
-    data = train_dataset.graph
-    data = T.ToUndirected()(data)
+    @cached_property
+    def data(self) -> HeteroData:
+        return T.ToUndirected()(self.train_dataset.graph)
 
-    customer_id_map = read_json("data/derived/customer_id_map_forward.json")
-    article_id_map = read_json("data/derived/article_id_map_forward.json")
+    """ UTILITY METHODS """
 
-    return (
-        train_loader,
-        val_loader,
-        test_loader,
-        customer_id_map,
-        article_id_map,
-        data,
+    def __create_dataset(
+        self, split_type: str, train: bool, matchers: Optional[list] = None
+    ) -> Union[GraphDataset, GraphDatasetNeo]:
+        Dataset = GraphDatasetNeo if self.config.neo4j else GraphDataset
+        return Dataset(
+            config=self.config,
+            graph_path=self.data_dir + f"{split_type}_graph.pt",
+            users_adj_list=self.data_dir + f"edges_{split_type}.pt",
+            articles_adj_list=self.data_dir + f"rev_edges_{split_type}.pt",
+            train=train,
+            split_type=split_type,
+            matchers=matchers,
+        )
+
+    def __eval_dataset(self, split_type: str):
+        dataset = self.__create_dataset(
+            split_type,
+            train=False,
+            matchers=get_matchers(
+                self.config.matchers, split_type, self.config.candidate_pool_size
+            ),
+        )
+        if self.config.eval_snapshots:
+            dataset = materialize_snapshot(
+                dataset, self.data_dir + f"snapshots/{split_type}", self.config
+            )
+        return dataset
+
+    def __create_loader(
+        self, Loader: type, dataset, args: dict, name: str
+    ) -> "FirstBatchTimer":
+        # Snapshots have no adjacency to estimate subgraph sizes from, they keep random batches
+        batch_sampler = (
+            None
+            if isinstance(dataset, SnapshotDataset)
+            else create_batch_sampler(dataset, self.config, args["shuffle"])
+        )
+        if batch_sampler is not None:
+            # The batch sampler decides the size and the order of the batches
+            args = {
+                key: value
+                for key, value in args.items()
+                if key not in ["batch_size", "shuffle"]
+            }
+            args["batch_sampler"] = batch_sampler
+        return FirstBatchTimer(Loader(dataset, **args), name, self.created_at)
+
+    def __loader_class(self) -> Tuple[type, dict]:
+        config = self.config
+        if (
+            config.neo4j
+            and config.neo4j_backend == "server"
+            and config.neo4j_prefetch > 0
+        ):
+            # The queries overlap with training through the async driver, there are no worker processes
+            return AsyncPrefetchLoader, dict(
+                batch_size=config.batch_size,
+                shuffle=True,
+                in_flight=config.neo4j_prefetch,
+            )
+
+        Loader = BatchSamplingLoader if config.batched_sampling else DataLoader
+        return Loader, dict(
+            batch_size=config.batch_size, shuffle=True, **worker_args(config)
+        )
+
+    def __eval_loader_class(self) -> Tuple[type, dict]:
+        if self.config.eval_snapshots:
+            # Snapshots are already sampled, they are served one subgraph at a time
+            return DataLoader, dict(
+                batch_size=self.config.batch_size,
+                shuffle=True,
+                **worker_args(self.config),
+            )
+        return self.__loader_class()
+
+
+class FirstBatchTimer:
+    """Passes a loader through, reports how long its first batch took (startup included)"""
+
+    def __init__(self, loader, name: str, created_at: float):
+        self.loader = loader
+        self.name = name
+        self.created_at = created_at
+        self.time_to_first_batch: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self.loader)
+
+    def __getattr__(self, name: str):
+        if name == "loader":
+            # Not set yet (eg.: while unpickling)
+            raise AttributeError(name)
+        return getattr(self.loader, name)
+
+    def __iter__(self) -> Iterator:
+        started_at = time.perf_counter()
+        iterator = iter(self.loader)
+        if self.time_to_first_batch is None:
+            first = next(iterator, None)
+            if first is None:
+                return
+            now = time.perf_counter()
+            self.time_to_first_batch = now - self.created_at
+            print(
+                f"| First {self.name} batch after {now - started_at:.2f}s ({self.time_to_first_batch:.2f}s since create_dataloaders)"
+            )
+            yield first
+        yield from iterator
+
+
+def worker_args(config: Config) -> dict:
+    if config.num_workers == 0:
+        return dict()
+
+    return dict(
+        num_workers=config.num_workers,
+        persistent_workers=config.persistent_workers,
+        prefetch_factor=config.prefetch_factor,
+        worker_init_fn=worker_init_fn,
     )
 
 
-def read_json(filename: str):
-    with open(filename) as f_in:
-        return json.load(f_in)
+def worker_init_fn(worker_id: int):
+    """Seeds every worker differently and lets the dataset open its per-worker resources (eg.: the neo4j driver)"""
+    worker_info = get_worker_info()
+    # torch is already seeded by the DataLoader with base_seed + worker_id
+    random.seed(worker_info.seed)
+    np.random.seed(worker_info.seed % 2**32)
+
+    dataset = getattr(worker_info.dataset, "graph_dataset", worker_info.dataset)
+    if hasattr(dataset, "init_worker"):
+        dataset.init_worker()
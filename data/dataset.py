@@ -6,8 +6,10 @@ from typing import Tuple, Union, Optional, List
 from .matching.type import Matcher
 from utils.constants import Constants
 from config import Config
-from utils.flatten import flatten
-import random
+from .adjacency import CSRAdjacency
+from .feature_store import load_graph
+from .relabel import Relabeler
+from .sampling import AliasTable, sample_negative_edges, sample_per_group
 
 device = t.device("cuda" if t.cuda.is_available() else "cpu")
 
@@ -25,23 +27,42 @@ class GraphDataset(InMemoryDataset):
         split_type: Optional[str] = None,
     ):
 
-        self.graph = t.load(graph_path)
-        self.articles = t.load(articles_adj_list)
-        self.users = t.load(users_adj_list)
+        # What the subgraphs are sampled from, snapshots are rebuilt when one of them changes
+        self.source_files = [graph_path, users_adj_list, articles_adj_list]
+        # Kept in shared memory (features are memory-mapped), so dataloader workers don't get their own copy
+        self.graph = load_graph(graph_path)
+        self.articles = CSRAdjacency.from_dict(
+            t.load(articles_adj_list),
+            num_rows=self.graph[Constants.node_item].num_nodes,
+        ).share_memory_()
+        self.users = CSRAdjacency.from_dict(t.load(users_adj_list)).share_memory_()
+        self.num_articles = self.graph[Constants.node_item].num_nodes
         self.matchers = matchers
         self.config = config
         self.train = train
+        # Built once here, so that the dataloader workers share the same table as well
+        self.article_sampler = (
+            AliasTable.from_degrees(
+                self.articles.degree(), config.negative_sampling_alpha
+            ).share_memory_()
+            if train and config.negative_sampling == "degree"
+            else None
+        )
         self.randomization = randomization
+        self.relabel = Relabeler(
+            {
+                node_type: self.graph[node_type].num_nodes
+                for node_type in self.graph.node_types
+            }
+        )
 
     def __len__(self) -> int:
         return len(self.users)
 
     def __getitem__(self, idx: int) -> Union[Data, HeteroData]:
         """Create Edges"""
-        all_edges = self.graph[Constants.edge_key].edge_index
-        positive_article_indices = t.as_tensor(
-            self.users[idx], dtype=t.long
-        )  # all the positive target indices for the current user
+        # all the positive target indices for the current user
+        positive_article_indices = self.users[idx]
         positive_article_edges = create_edges_from_target_indices(
             idx, positive_article_indices
         )
@@ -78,31 +99,13 @@ class GraphDataset(InMemoryDataset):
             negative_edges_ratio = self.config.negative_edges_ratio
 
         if self.train:
-            # Randomly select from the whole graph
-            sampled_negative_article_edges = create_edges_from_target_indices(
-                idx,
-                get_negative_edges_random(
-                    subgraph_edges_to_filter=sampled_positive_article_indices,
-                    all_edges=all_edges,
-                    num_negative_edges=int(
-                        negative_edges_ratio * num_sampled_pos_edges
-                    ),
-                    randomization=self.randomization,
-                ),
+            sampled_negative_article_edges = self.get_negative_edges(
+                t.tensor([idx]),
+                t.tensor([int(negative_edges_ratio * num_sampled_pos_edges)]),
             )
         else:
-            assert self.matchers is not None, "Must provide matchers for test"
-            # Select according to a heuristic (eg.: lightgcn scores)
-            candidates = t.cat(
-                [matcher.get_matches(idx) for matcher in self.matchers],
-                dim=0,
-            ).unique()
-            # but never add positive edges
             sampled_negative_article_edges = create_edges_from_target_indices(
-                idx,
-                only_items_with_count_one(
-                    t.cat([candidates, positive_article_indices], dim=0)
-                ),
+                idx, self.get_candidates(idx)
             )
 
         n_hop_edges = fetch_n_hop_neighbourhood(
@@ -113,42 +116,34 @@ class GraphDataset(InMemoryDataset):
             num_neighbors=self.config.num_neighbors,
         )
 
-        all_touched_edges = t.cat(
+        all_subgraph_edges = t.cat(
             [
                 positive_article_edges,
-                sampled_negative_article_edges,
                 n_hop_edges,
             ],
             dim=1,
         )
 
-        all_subgraph_edges = t.cat(
-            [
-                positive_article_edges,
-                n_hop_edges,
-            ],
-            dim=1,
+        """ Remap and Prepare Edges """
+        node_ids, (subgraph_edges, sampled_edges) = self.relabel(
+            {Constants.edge_key: all_subgraph_edges},
+            {
+                Constants.edge_key: t.cat(
+                    [sampled_positive_article_edges, sampled_negative_article_edges],
+                    dim=1,
+                )
+            },
         )
+        all_subgraph_edges = subgraph_edges[Constants.edge_key]
+        all_sampled_edges = sampled_edges[Constants.edge_key]
 
         """ Node Features """
-        user_buckets = t.unique(all_touched_edges[0], sorted=True)
-        article_buckets = t.unique(all_touched_edges[1], sorted=True)
+        user_buckets = node_ids[Constants.node_user]
+        article_buckets = node_ids[Constants.node_item]
 
         user_features = self.graph[Constants.node_user].x[user_buckets]
         article_features = self.graph[Constants.node_item].x[article_buckets]
 
-        """ Remap and Prepare Edges """
-        all_subgraph_edges = remap_edges_to_start_from_zero(
-            all_subgraph_edges, user_buckets, article_buckets
-        )
-        all_sampled_edges = remap_edges_to_start_from_zero(
-            t.cat(
-                [sampled_positive_article_edges, sampled_negative_article_edges], dim=1
-            ),
-            user_buckets,
-            article_buckets,
-        )
-
         # Prepare identifier of labels
         labels = t.cat(
             [
@@ -164,6 +159,8 @@ class GraphDataset(InMemoryDataset):
         data = HeteroData()
         data[Constants.node_user].x = user_features
         data[Constants.node_item].x = article_features
+        data[Constants.node_user].n_id = user_buckets
+        data[Constants.node_item].n_id = article_buckets
 
         # Add original directional edges
         data[Constants.edge_key].edge_index = all_subgraph_edges.type(t.long)
@@ -181,64 +178,134 @@ class GraphDataset(InMemoryDataset):
         data[Constants.rev_edge_key].edge_label = labels.type(t.long)
         return data
 
+    def sample_batch(self, user_ids: Tensor) -> HeteroData:
+        """
+        Vectorized version of __getitem__ for a whole batch of customers.
+        Returns a single subgraph that is the union of the neighbourhoods of all customers in the batch.
+        """
+        user_ids = t.as_tensor(user_ids, dtype=t.long)
 
-def only_items_with_count_one(input: t.Tensor) -> t.Tensor:
-    uniques, counts = input.unique(return_counts=True)
-    return uniques[counts == 1]
+        """ Positive Sample """
+        positive_article_edges = self.users.edges(user_ids)
+        num_positives = self.users.degree(user_ids)
+        row_starts = self.users.indptr[user_ids]
 
+        if self.randomization:
+            samp_cuts = t.clamp(
+                t.floor(num_positives * self.config.positive_edges_ratio).to(t.long),
+                min=1,
+            )
+            sampled_users = t.repeat_interleave(user_ids, samp_cuts)
+            positions = t.repeat_interleave(row_starts, samp_cuts) + (
+                t.rand(sampled_users.shape[0], dtype=t.float64)
+                * t.repeat_interleave(num_positives, samp_cuts)
+            ).to(t.long)
+        else:
+            # Rows are sorted, so the first and last positions are the smallest and biggest article ids
+            samp_cuts = t.full_like(user_ids, 2)
+            sampled_users = t.repeat_interleave(user_ids, samp_cuts)
+            positions = t.stack([row_starts, row_starts + num_positives - 1], dim=1)
+            positions = positions.view(-1)
+
+        sampled_positive_article_edges = t.stack(
+            [sampled_users, self.users.indices[positions].to(t.long)], dim=0
+        )
 
-def get_negative_edges_random(
-    subgraph_edges_to_filter: Tensor,
-    all_edges: Tensor,
-    num_negative_edges: int,
-    randomization: bool,
-) -> Tensor:
-
-    # Get the biggest value available in articles (potential edges to sample from)
-    id_max = t.max(all_edges, dim=1)[0][1]
+        """ Negative Sample """
+        negative_edges_ratios = t.where(
+            samp_cuts <= 1,
+            t.tensor(float(self.config.k - 1)),
+            t.tensor(float(self.config.negative_edges_ratio)),
+        )
+        num_negatives = (negative_edges_ratios * samp_cuts).to(t.long)
 
-    if all_edges.shape[1] / num_negative_edges > 100:
-        # If the number of edges is high, it is unlikely we get a positive edge, no need for expensive filter operations
-        if randomization:
-            random_integers = t.randint(
-                low=0, high=id_max.item(), size=(num_negative_edges,)
+        if self.train:
+            sampled_negative_article_edges = self.get_negative_edges(
+                user_ids, num_negatives
             )
         else:
-            random_integers = t.tensor([id_max.item()])
+            sampled_negative_article_edges = self.get_candidates_batch(user_ids)
 
-        return random_integers
+        """ Neighbourhood """
+        n_hop_edges = fetch_n_hop_neighbourhood_batch(
+            self.config.n_hop_neighbors,
+            user_ids,
+            self.users,
+            self.articles,
+            num_neighbors=self.config.num_neighbors,
+        )
+        all_subgraph_edges = t.cat([positive_article_edges, n_hop_edges], dim=1)
+        all_sampled_edges = t.cat(
+            [sampled_positive_article_edges, sampled_negative_article_edges], dim=1
+        )
+        labels = t.cat(
+            [
+                t.ones(sampled_positive_article_edges.shape[1], dtype=t.long),
+                t.zeros(sampled_negative_article_edges.shape[1], dtype=t.long),
+            ],
+            dim=0,
+        )
 
-    else:
-        # Create list of potential negative edges, filter out positive edges
-        only_negative_edges = only_items_with_count_one(
-            t.cat(
-                (
-                    t.arange(start=0, end=id_max + 1, dtype=t.int64),
-                    subgraph_edges_to_filter,
-                ),
-                dim=0,
-            )
+        """ Remap and Prepare Edges """
+        node_ids, (subgraph_edges, sampled_edges) = self.relabel(
+            {Constants.edge_key: all_subgraph_edges},
+            {Constants.edge_key: all_sampled_edges},
         )
+        all_subgraph_edges = subgraph_edges[Constants.edge_key]
+        all_sampled_edges = sampled_edges[Constants.edge_key]
+        user_buckets = node_ids[Constants.node_user]
+        article_buckets = node_ids[Constants.node_item]
 
-        # Randomly sample negative edges
-        if randomization:
-            random_integers = t.randperm(only_negative_edges.nelement())
-            negative_edges = only_negative_edges[random_integers][:num_negative_edges]
-        else:
-            negative_edges = t.tensor([id_max.item()])
+        """ Create Data """
+        data = HeteroData()
+        data[Constants.node_user].x = self.graph[Constants.node_user].x[user_buckets]
+        data[Constants.node_item].x = self.graph[Constants.node_item].x[article_buckets]
+        data[Constants.node_user].n_id = user_buckets
+        data[Constants.node_item].n_id = article_buckets
 
-        return negative_edges
+        reverse_key = t.LongTensor([1, 0])
+        data[Constants.edge_key].edge_index = all_subgraph_edges
+        data[Constants.edge_key].edge_label_index = all_sampled_edges
+        data[Constants.edge_key].edge_label = labels
+        data[Constants.rev_edge_key].edge_index = all_subgraph_edges[reverse_key]
+        data[Constants.rev_edge_key].edge_label_index = all_sampled_edges[reverse_key]
+        data[Constants.rev_edge_key].edge_label = labels
+        return data
 
+    def get_negative_edges(self, user_ids: Tensor, num_negatives: Tensor) -> Tensor:
+        """Randomly select from the whole catalog (uniformly or by popularity), never picking a positive edge of the customer"""
+        if self.randomization:
+            return sample_negative_edges(
+                self.users,
+                user_ids,
+                num_negatives,
+                self.num_articles,
+                self.article_sampler,
+            )
+        else:
+            return t.stack(
+                [user_ids, t.full_like(user_ids, self.num_articles - 1)], dim=0
+            )
 
-def remap_edges_to_start_from_zero(
-    edges: Tensor, buckets_1st_dim: Tensor, buckets_2nd_dim: Tensor
-) -> Tensor:
-    return t.stack(
-        (
-            t.bucketize(edges[0], buckets_1st_dim),
-            t.bucketize(edges[1], buckets_2nd_dim),
-        )
-    )
+    def get_candidates(self, idx: int) -> Tensor:
+        """Candidates from the matchers that are not positive edges of the customer"""
+        assert self.matchers is not None, "Must provide matchers for test"
+        # Select according to a heuristic (eg.: lightgcn scores)
+        candidates = t.cat(
+            [matcher.get_matches(idx) for matcher in self.matchers],
+            dim=0,
+        ).unique()
+        # but never add positive edges
+        return candidates[~t.isin(candidates, self.users[idx])]
+
+    def get_candidates_batch(self, user_ids: Tensor) -> Tensor:
+        """Batched get_candidates, as [2, num_candidates] (customer, article) edges"""
+        assert self.matchers is not None, "Must provide matchers for test"
+        candidates = t.cat(
+            [matcher.get_matches_batch(user_ids) for matcher in self.matchers],
+            dim=1,
+        ).unique(dim=1)
+        return candidates[:, ~self.users.contains(candidates[0], candidates[1])]
 
 
 def create_edges_from_target_indices(
@@ -256,52 +323,87 @@ def create_edges_from_target_indices(
 
 
 def fetch_n_hop_neighbourhood(
-    n: int, user_id: int, users: dict, articles: dict, num_neighbors: int
+    n: int,
+    user_id: int,
+    users: CSRAdjacency,
+    articles: CSRAdjacency,
+    num_neighbors: int,
 ) -> t.Tensor:
     """Returns the edges from the n-hop neighbourhood of the user, without the direct links for the same user"""
-    accum_edges = t.tensor([[], []], dtype=t.long)
-    users_explored = set([])
-    users_queue = set([user_id])
+    accum_edges = [t.tensor([[], []], dtype=t.long)]
+    users_queue = t.tensor([user_id], dtype=t.long)
+    users_explored = users_queue
 
     for i in range(0, n):
-        new_articles_and_edges = [
-            create_neighbouring_article_edges(user, users) for user in users_queue
-        ]
-        users_explored = users_explored | users_queue
-        if len(new_articles_and_edges) == 0:
+        if users_queue.numel() == 0:
             break
-        new_articles = flatten([x[0] for x in new_articles_and_edges])
+        new_articles = users.neighbours(users_queue)
 
         if i != 0:
-            new_edges = t.cat([x[1] for x in new_articles_and_edges], dim=1)
-            accum_edges = t.cat([accum_edges, new_edges], dim=1)
+            accum_edges.append(users.edges(users_queue))
 
         articles_queue = shuffle_and_cut(new_articles, num_neighbors)
-        new_users = (
-            set(flatten([articles[article] for article in articles_queue]))
-            - users_explored
-        )  # remove the intersection between the two sets, so we only explore a user once
-        users_queue = set(shuffle_and_cut(list(new_users), num_neighbors))
+        new_users = articles.neighbours(articles_queue).unique()
+        # remove the users we have already visited, so we only explore a user once
+        new_users = new_users[~t.isin(new_users, users_explored)]
+        users_queue = shuffle_and_cut(new_users, num_neighbors)
+        users_explored = t.cat([users_explored, users_queue])
 
-    return accum_edges
+    return t.cat(accum_edges, dim=1)
 
 
-def shuffle_and_cut(array: list, n: int) -> list:
-    if len(array) > n:
-        return random.sample(array, n)
-    else:
-        return array
+def fetch_n_hop_neighbourhood_batch(
+    n: int,
+    user_ids: Tensor,
+    users: CSRAdjacency,
+    articles: CSRAdjacency,
+    num_neighbors: int,
+) -> t.Tensor:
+    """
+    Batched fetch_n_hop_neighbourhood: every user keeps its own frontier and its own num_neighbors budget,
+    returns the union of the edges of all neighbourhoods
+    """
+    num_users = users.num_rows
+    # The frontier is kept as (position of the seed user in the batch, user id) pairs, encoded in one key
+    queue_seeds = t.arange(user_ids.shape[0])
+    users_queue = user_ids
+    keys_explored = queue_seeds * num_users + users_queue
+    users_to_expand = [t.empty(0, dtype=t.long)]
 
+    for i in range(0, n):
+        if users_queue.numel() == 0:
+            break
+        article_seeds = t.repeat_interleave(queue_seeds, users.degree(users_queue))
+        new_articles = users.neighbours(users_queue)
 
-def create_neighbouring_article_edges(
-    user_id: int, users: dict
-) -> Tuple[List[int], Tensor]:
-    """Fetch neighbouring articles for a user, returns the article ids (list[int]) & edges (Tensor)"""
-    articles_purchased = users[user_id]
-    edges_to_articles = create_edges_from_target_indices(
-        user_id, t.as_tensor(articles_purchased, dtype=t.long)
-    )
-    return articles_purchased, edges_to_articles
+        if i != 0:
+            users_to_expand.append(users_queue)
+
+        keep = sample_per_group(article_seeds, num_neighbors)
+        article_seeds, articles_queue = article_seeds[keep], new_articles[keep]
+
+        user_seeds = t.repeat_interleave(article_seeds, articles.degree(articles_queue))
+        new_keys = (
+            user_seeds * num_users + articles.neighbours(articles_queue)
+        ).unique()
+        # remove the users we have already visited from the same seed, so we only explore a user once
+        new_keys = new_keys[~t.isin(new_keys, keys_explored)]
+        new_keys = new_keys[sample_per_group(new_keys // num_users, num_neighbors)]
+
+        queue_seeds, users_queue = new_keys // num_users, new_keys % num_users
+        keys_explored = t.cat([keys_explored, new_keys])
+
+    # Users reached from several seeds contribute their edges only once,
+    # and the direct links of the seeds are added by the caller as positive edges
+    users_to_expand = t.cat(users_to_expand).unique()
+    return users.edges(users_to_expand[~t.isin(users_to_expand, user_ids)])
+
+
+def shuffle_and_cut(array: Tensor, n: int) -> Tensor:
+    if array.numel() > n:
+        return array[t.randperm(array.numel())[:n]]
+    else:
+        return array
 
 
 def shuffle_edges_and_labels(edges: Tensor, labels: Tensor) -> Tuple[Tensor, Tensor]:
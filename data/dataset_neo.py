@@ -1,7 +1,7 @@
 from numpy import dtype
 import torch as t
 import math
-from torch_geometric.data import Data, HeteroData, InMemoryDataset
+from torch_geometric.data import Batch, Data, HeteroData, InMemoryDataset
 from torch import Tensor
 from typing import Tuple, Union, Optional, List
 from .matching.type import Matcher
@@ -10,9 +10,15 @@ from config import Config
 from utils.flatten import flatten
 import random
 from data.neo4j.neo4j_database import Database
-from data.neo4j.utils import get_neighborhood, get_id_map
+from data.neo4j.in_memory_database import InMemoryDatabase
+from data.neo4j.utils import get_neighborhood, get_neighborhood_batch, get_id_map
+from data.neo4j.cache import neighborhood_cache_from_config
 from utils.tensor import check_edge_index_flat_unique
 from collections import defaultdict
+from .adjacency import CSRAdjacency
+from .feature_store import load_graph
+from .relabel import Relabeler
+from .sampling import AliasTable, sample_negative_items
 
 
 device = t.device("cuda" if t.cuda.is_available() else "cpu")
@@ -32,33 +38,109 @@ class GraphDataset(InMemoryDataset):
         db_param: Tuple[str, str, str] = ("bolt://localhost:7687", "neo4j", "password"),
     ):
 
-        self.graph = t.load(graph_path)
-        self.articles = t.load(articles_adj_list)
-        self.users = t.load(users_adj_list)
+        # What the subgraphs are sampled from, snapshots are rebuilt when one of them changes
+        self.source_files = [graph_path, users_adj_list, articles_adj_list]
+        # Kept in shared memory (features are memory-mapped), so dataloader workers don't get their own copy
+        self.graph = load_graph(graph_path)
+        self.articles = CSRAdjacency.from_dict(
+            t.load(articles_adj_list),
+            num_rows=self.graph[Constants.node_item].num_nodes,
+        ).share_memory_()
+        self.users = CSRAdjacency.from_dict(t.load(users_adj_list)).share_memory_()
+        self.num_articles = self.graph[Constants.node_item].num_nodes
         self.matchers = matchers
         self.config = config
         self.train = train
+        # Built once here, so that the dataloader workers share the same table as well
+        self.article_sampler = (
+            AliasTable.from_degrees(
+                self.articles.degree(), config.negative_sampling_alpha
+            ).share_memory_()
+            if train and config.negative_sampling == "degree"
+            else None
+        )
         self.randomization = randomization
-        self.db = Database(db_param[0], db_param[1], db_param[2])
+        # The driver is not fork-safe, every worker opens its own in init_worker
+        self.db_param = db_param
+        self._db: Optional[Union[Database, InMemoryDatabase]] = None
+        if config.neo4j_backend == "memory":
+            self._db = InMemoryDatabase({split_type: self.graph})
         self.split_type = split_type
+        # Fan-out of every hop, sampled by the database (-1 takes the whole n-hop subgraph)
+        self.num_neighbors = config.num_neighbors if config.num_neighbors >= 0 else None
+        self.neighborhood_cache = neighborhood_cache_from_config(config, train)
+        self.relabel = Relabeler(
+            {
+                node_type: self.graph[node_type].num_nodes
+                for node_type in self.graph.node_types
+            }
+        )
+
+    @property
+    def db(self) -> Union[Database, InMemoryDatabase]:
+        if self._db is None:
+            self.init_worker()
+        return self._db
+
+    def init_worker(self):
+        if self.config.neo4j_backend == "memory":
+            return
+        self._db = Database(
+            *self.db_param,
+            pool_size=self.config.neo4j_pool_size,
+            fetch_size=self.config.neo4j_fetch_size,
+        )
+        self._db.check_id_type()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        if self.config.neo4j_backend == "server":
+            state["_db"] = None
+        return state
 
     def __len__(self) -> int:
         return len(self.users)
 
     def __getitem__(self, idx: int) -> Union[Data, HeteroData]:
-        """Get Subgraph Edges, Sampled Edges and Features"""
-        edge_label_index, edge_label = self.get_edge_label_index(idx)
         neighborhood = get_neighborhood(
             self.db,
             node_id=idx,
             n_neighbor=self.config.n_hop_neighbors,
             start_neighbor=1,
             split_type=self.split_type,
+            cache=self.neighborhood_cache,
+            num_neighbors=self.num_neighbors,
+        )
+        return self.create_subgraph(idx, neighborhood)
+
+    def sample_batch(self, user_ids: Tensor) -> Batch:
+        """
+        Fetches the neighborhoods of the whole batch with one query (instead of a round trip per customer),
+        returns the subgraphs of the customers collated the same way the DataLoader would.
+        """
+        user_ids = t.as_tensor(user_ids, dtype=t.long).tolist()
+        neighborhoods = get_neighborhood_batch(
+            self.db,
+            node_ids=user_ids,
+            n_neighbor=self.config.n_hop_neighbors,
+            start_neighbor=1,
+            split_type=self.split_type,
+            cache=self.neighborhood_cache,
+            num_neighbors=self.num_neighbors,
         )
+        return self.create_batch(user_ids, neighborhoods)
+
+    def create_batch(self, user_ids: List[int], neighborhoods: dict) -> Batch:
+        return Batch.from_data_list(
+            [self.create_subgraph(idx, neighborhoods[idx]) for idx in user_ids]
+        )
+
+    def create_subgraph(self, idx: int, neighborhood: dict) -> HeteroData:
+        """Get Subgraph Edges, Sampled Edges and Features"""
+        edge_label_index, edge_label = self.get_edge_label_index(idx)
         edge_index = self.get_edge_indexes(edge_label_index, edge_label, neighborhood)
-        original_node_ids = self.get_original_node_ids(edge_index, edge_label_index)
-        edge_index, edge_label_index = self.remap_indexes(
-            edge_index, edge_label_index, original_node_ids
+        original_node_ids, (edge_index, edge_label_index) = self.relabel(
+            edge_index, edge_label_index
         )
 
         """ Create Data """
@@ -68,6 +150,7 @@ class GraphDataset(InMemoryDataset):
             data[node_type].x = (
                 self.graph[node_type].x[original_node_ids[node_type]].type(t.long)
             )
+            data[node_type].n_id = original_node_ids[node_type]
 
         # Add original directional edges and reverse edges
         reverse_key = t.LongTensor([1, 0])
@@ -92,51 +175,6 @@ class GraphDataset(InMemoryDataset):
 
         return data
 
-    def remap_indexes(
-        self, edge_index: dict, edge_label_index: dict, original_ids: dict
-    ) -> dict:
-        for key, item in edge_index.items():
-            edge_index[key] = remap_edges_to_start_from_zero(
-                item, original_ids[key[0]], original_ids[key[2]]
-            )
-
-        for key, item in edge_label_index.items():
-            edge_label_index[key] = remap_edges_to_start_from_zero(
-                item, original_ids[key[0]], original_ids[key[2]]
-            )
-
-        return edge_index, edge_label_index
-
-    def get_original_node_ids(self, edge_index: dict, edge_label_index: dict) -> dict:
-        original_node_ids = defaultdict(Tensor)
-
-        for edge_key, item in edge_index.items():
-            if item.shape[0] == 0:
-                continue
-            original_node_ids[edge_key[0]] = t.cat(
-                [original_node_ids[edge_key[0]], item[0]], dim=0
-            ).type(t.long)
-
-            original_node_ids[edge_key[2]] = t.cat(
-                [original_node_ids[edge_key[2]], item[1]], dim=0
-            ).type(t.long)
-
-        for edge_key, item in edge_label_index.items():
-            if item.shape[0] == 0:
-                continue
-            original_node_ids[edge_key[0]] = t.cat(
-                [original_node_ids[edge_key[0]], item[0]], dim=0
-            ).type(t.long)
-
-            original_node_ids[edge_key[2]] = t.cat(
-                [original_node_ids[edge_key[2]], item[1]], dim=0
-            ).type(t.long)
-
-        for key, item in original_node_ids.items():
-            original_node_ids[key] = t.unique(item)
-
-        return original_node_ids
-
     def get_edge_indexes(
         self, edge_label_index: Tensor, edge_label: Tensor, neighborhood: Tensor
     ) -> Tensor:
@@ -172,11 +210,9 @@ class GraphDataset(InMemoryDataset):
         edge_label = dict()
 
         for edge_type in self.config.default_edge_types:
-            all_edges = self.graph[edge_type].edge_index
-
             """ Positive Sample """
             # We will have to modify self.users to be a disctionary of self.users[idx][edge_type]
-            positive_article_indices = t.as_tensor(self.users[idx], dtype=t.long)
+            positive_article_indices = self.users[idx]
             positive_sample = self.get_positive_sampled_edges(
                 idx, positive_article_indices
             )
@@ -190,8 +226,6 @@ class GraphDataset(InMemoryDataset):
                 negative_edges_ratio = self.config.negative_edges_ratio
 
             negative_sample = self.get_negative_sampled_edges(
-                all_edges,
-                positive_sample,
                 positive_article_indices,
                 idx,
                 negative_edges_ratio,
@@ -242,25 +276,23 @@ class GraphDataset(InMemoryDataset):
 
     def get_negative_sampled_edges(
         self,
-        all_edges: Tensor,
-        sampled_positive_article_indices: Tensor,
         positive_article_indices: Tensor,
         idx: int,
         negative_edges_ratio: float,
         num_sampled_pos_edges: int,
     ) -> Tensor:
         if self.train:
-            # Randomly select from the whole graph
+            # Randomly select from the whole catalog, never picking a positive edge
             sampled_negative_article_edges = create_edges_from_target_indices(
                 idx,
-                get_negative_edges_random(
-                    subgraph_edges_to_filter=sampled_positive_article_indices,
-                    all_edges=all_edges,
-                    num_negative_edges=int(
-                        negative_edges_ratio * num_sampled_pos_edges
-                    ),
-                    randomization=self.randomization,
-                ),
+                sample_negative_items(
+                    positive_article_indices,
+                    self.num_articles,
+                    int(negative_edges_ratio * num_sampled_pos_edges),
+                    self.article_sampler,
+                )
+                if self.randomization
+                else t.tensor([self.num_articles - 1]),
             )
         else:
             assert self.matchers is not None, "Must provide matchers for test"
@@ -271,73 +303,11 @@ class GraphDataset(InMemoryDataset):
             ).unique()
             # but never add positive edges
             sampled_negative_article_edges = create_edges_from_target_indices(
-                idx,
-                only_items_with_count_one(
-                    t.cat([candidates, positive_article_indices], dim=0)
-                ),
+                idx, candidates[~t.isin(candidates, positive_article_indices)]
             )
         return sampled_negative_article_edges
 
 
-def only_items_with_count_one(input: t.Tensor) -> t.Tensor:
-    uniques, counts = input.unique(return_counts=True)
-    return uniques[counts == 1]
-
-
-def get_negative_edges_random(
-    subgraph_edges_to_filter: Tensor,
-    all_edges: Tensor,
-    num_negative_edges: int,
-    randomization: bool,
-) -> Tensor:
-
-    # Get the biggest value available in articles (potential edges to sample from)
-    id_max = t.max(all_edges, dim=1)[0][1]
-
-    if all_edges.shape[1] / num_negative_edges > 100:
-        # If the number of edges is high, it is unlikely we get a positive edge, no need for expensive filter operations
-        if randomization:
-            random_integers = t.randint(
-                low=0, high=id_max.item(), size=(num_negative_edges,)
-            )
-        else:
-            random_integers = t.tensor([id_max.item()])
-
-        return random_integers
-
-    else:
-        # Create list of potential negative edges, filter out positive edges
-        only_negative_edges = only_items_with_count_one(
-            t.cat(
-                (
-                    t.arange(start=0, end=id_max + 1, dtype=t.int64),
-                    subgraph_edges_to_filter,
-                ),
-                dim=0,
-            )
-        )
-
-        # Randomly sample negative edges
-        if randomization:
-            random_integers = t.randperm(only_negative_edges.nelement())
-            negative_edges = only_negative_edges[random_integers][:num_negative_edges]
-        else:
-            negative_edges = t.tensor([id_max.item()])
-
-        return negative_edges
-
-
-def remap_edges_to_start_from_zero(
-    edges: Tensor, buckets_1st_dim: Tensor, buckets_2nd_dim: Tensor
-) -> Tensor:
-    return t.stack(
-        (
-            t.bucketize(edges[0], buckets_1st_dim),
-            t.bucketize(edges[1], buckets_2nd_dim),
-        )
-    )
-
-
 def create_edges_from_target_indices(
     source_index: int, target_indices: Tensor
 ) -> Tensor:
@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import torch as t
+from functools import lru_cache
+from typing import Optional
+from torch_geometric.data import HeteroData
+
+feature_store_dir = "data/derived/features/"
+
+
+def save_node_features(
+    graph: HeteroData, directory: str = feature_store_dir
+) -> HeteroData:
+    """
+    Writes the features of every node type once to `{directory}/{node_type}.npy`,
+    returns the graph without them (the split graphs only keep the number of nodes).
+    """
+    os.makedirs(directory, exist_ok=True)
+    for node_type in graph.node_types:
+        np.save(os.path.join(directory, f"{node_type}.npy"), graph[node_type].x.numpy())
+    return strip_node_features(graph)
+
+
+def strip_node_features(graph: HeteroData) -> HeteroData:
+    for node_type in graph.node_types:
+        if "x" in graph[node_type]:
+            graph[node_type].num_nodes = graph[node_type].x.shape[0]
+            del graph[node_type].x
+    return graph
+
+
+@lru_cache(maxsize=None)
+def load_node_features(node_type: str, directory: str = feature_store_dir) -> t.Tensor:
+    """Memory-mapped features of a node type, the same tensor is returned for every split"""
+    # copy-on-write mapping: the pages are shared with the file (and between processes) until written to
+    return t.from_numpy(
+        np.load(os.path.join(directory, f"{node_type}.npy"), mmap_mode="c")
+    )
+
+
+def load_graph(path: str, directory: Optional[str] = None) -> HeteroData:
+    """
+    Loads a split graph with its structure in shared memory, and attaches the node features from the feature store
+    next to it (`features/` in the graph's directory, unless given), graphs saved before the feature store existed
+    still carry their own features.
+    """
+    if directory is None:
+        directory = os.path.join(os.path.dirname(path), "features")
+    graph = t.load(path)
+    graph.apply(lambda x: x.share_memory_())
+    for node_type in graph.node_types:
+        if "x" not in graph[node_type]:
+            x = load_node_features(node_type, directory)
+            assert (
+                x.shape[0] == graph[node_type].num_nodes
+            ), f"{directory} has {x.shape[0]} {node_type} rows, the graph {graph[node_type].num_nodes}"
+            graph[node_type].x = x
+    return graph
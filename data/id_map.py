@@ -0,0 +1,53 @@
+import numpy as np
+from typing import Optional, Tuple
+
+
+class IdMap:
+    """
+    Node index -> original id, as a numpy array (memory-mapped when loaded from disk).
+    The reverse lookup (original id -> node index) is a searchsorted on the sorted ids,
+    there is no dict with an entry per node.
+    """
+
+    def __init__(self, ids: np.ndarray):
+        self.ids = ids
+        self.__sorted: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @staticmethod
+    def from_values(values) -> "IdMap":
+        ids = np.asarray(values)
+        if ids.dtype == object:
+            # Fixed width strings, so the array can be memory-mapped
+            ids = ids.astype(str)
+        return IdMap(ids)
+
+    @staticmethod
+    def load(path: str) -> "IdMap":
+        return IdMap(np.load(path, mmap_mode="r"))
+
+    def save(self, path: str):
+        np.save(path, np.asarray(self.ids))
+
+    def __len__(self) -> int:
+        return self.ids.shape[0]
+
+    def to_original(self, indices) -> np.ndarray:
+        return self.ids[np.asarray(indices)]
+
+    def to_index(self, ids) -> np.ndarray:
+        order, sorted_ids = self.__sorted_ids()
+        ids = np.asarray(ids)
+        if ids.dtype == object:
+            ids = ids.astype(str)
+        positions = np.searchsorted(sorted_ids, ids).clip(max=len(self) - 1)
+        found = sorted_ids[positions] == ids
+        if not found.all():
+            raise KeyError(f"Unknown ids: {ids[~found][:10].tolist()}")
+        return order[positions]
+
+    def __sorted_ids(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Built on the first reverse lookup, forward lookups don't need it
+        if self.__sorted is None:
+            order = np.argsort(self.ids, kind="stable")
+            self.__sorted = order, np.asarray(self.ids)[order]
+        return self.__sorted
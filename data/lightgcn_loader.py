@@ -3,7 +3,8 @@ from sklearn.model_selection import train_test_split
 import torch as t
 from torch_sparse import SparseTensor
 from torch_geometric.utils import structured_negative_sampling
-import json
+from data.feature_store import load_graph
+from data.id_map import IdMap
 
 """# Loading the Dataset
 We split the edges of the graph using a 80/10/10 train/validation/test split.
@@ -31,11 +32,6 @@ def split(edge_index):
     return train_edge_index, val_edge_index, test_edge_index, edge_index
 
 
-def read_json(filename: str):
-    with open(filename) as f_in:
-        return json.load(f_in)
-
-
 def both_indexes_from_zero(edge_index):
     new_edge_index = t.clone(edge_index)
     new_edge_index[1] = new_edge_index[1] - (t.max(new_edge_index[0]) + 1)
@@ -52,10 +48,10 @@ def index_based_mapping(id_based_mapping):
 
 
 def create_dataloaders_lightgcn():
-    data = t.load("data/derived/test_graph.pt").to_homogeneous()
+    data = load_graph("data/derived/test_graph.pt").to_homogeneous()
 
-    customer_id_map = read_json("data/derived/customer_id_map_forward.json")
-    article_id_map = read_json("data/derived/article_id_map_forward.json")
+    customer_id_map = IdMap.load("data/derived/customer_id_map.npy")
+    article_id_map = IdMap.load("data/derived/article_id_map.npy")
     num_users, num_articles = len(customer_id_map), len(article_id_map)
 
     edge_index = both_indexes_from_zero(data.edge_index)
@@ -1,9 +1,9 @@
 from torch_geometric.transforms import RandomLinkSplit
 from torch_geometric.data import HeteroData
 from data.types import ArticleIdMap, CustomerIdMap
+from data.id_map import IdMap
 from config import Config
 import torch as t
-import json
 from typing import Tuple
 import torch_geometric.transforms as T
 from torch_geometric.loader import NeighborLoader, LinkNeighborLoader
@@ -93,8 +93,8 @@ def create_dataloaders(
         pin_memory=True,
     )
 
-    customer_id_map = read_json("data/derived/customer_id_map_forward.json")
-    article_id_map = read_json("data/derived/article_id_map_forward.json")
+    customer_id_map = IdMap.load("data/derived/customer_id_map.npy")
+    article_id_map = IdMap.load("data/derived/article_id_map.npy")
 
     return (
         train_loader,
@@ -104,8 +104,3 @@ def create_dataloaders(
         article_id_map,
         data,
     )
-
-
-def read_json(filename: str):
-    with open(filename) as f_in:
-        return json.load(f_in)
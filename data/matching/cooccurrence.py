@@ -0,0 +1,94 @@
+import numpy as np
+import scipy.sparse as sp
+from typing import List, Optional
+from data.adjacency import CSRAdjacency
+
+
+class CoOccurrence:
+    """
+    Item-item co-occurrence counts (how many customers bought both items), computed once as a sparse matrix.
+    The score of an item for a customer is the number of (own item, co-purchaser) paths that lead to it,
+    ie.: the customer's purchase vector times the co-occurrence matrix.
+    """
+
+    def __init__(
+        self,
+        users: CSRAdjacency,
+        num_items: int,
+        block_size: int = 4096,
+        max_item_neighbors: Optional[int] = 200,
+    ):
+        self.purchases = sp.csr_matrix(
+            (
+                np.ones(users.num_edges, dtype=np.float32),
+                users.indices.numpy(),
+                users.indptr.numpy(),
+            ),
+            shape=(users.num_rows, num_items),
+        )
+        self.matrix = self.__co_occurrence(
+            self.purchases, block_size, max_item_neighbors
+        )
+
+    def top_k(self, user_ids: np.ndarray, k: int) -> List[np.ndarray]:
+        """
+        The k best scored items of every customer (best first), the items they already bought are left out.
+        Customers without purchases in the graph get no items.
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if self.purchases.shape[0] == 0:
+            return [np.empty(0, dtype=np.int64) for _ in user_ids]
+        known = (user_ids < self.purchases.shape[0]).astype(np.float32)
+        purchases = (
+            sp.diags(known)
+            @ self.purchases[user_ids.clip(max=self.purchases.shape[0] - 1)]
+        )
+        scores = (purchases @ self.matrix).tocsr()
+        # Own purchases get no score, they can't be candidates
+        scores = scores - scores.multiply(purchases > 0)
+        scores.eliminate_zeros()
+
+        top = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            items, row_scores = scores.indices[start:end], scores.data[start:end]
+            if items.shape[0] > k:
+                best = np.argpartition(-row_scores, k - 1)[:k]
+                items, row_scores = items[best], row_scores[best]
+            # Ties are broken by item id, so the result is deterministic
+            top.append(items[np.lexsort((items, -row_scores))].astype(np.int64))
+        return top
+
+    @staticmethod
+    def __co_occurrence(
+        purchases: sp.csr_matrix, block_size: int, max_item_neighbors: Optional[int]
+    ) -> sp.csr_matrix:
+        """
+        purchases^T @ purchases, a block of item rows at a time, the diagonal is dropped.
+        With max_item_neighbors every item only keeps its most frequent co-purchased items,
+        so the matrix stays bounded for items that co-occur with most of the catalog.
+        """
+        by_item = purchases.T.tocsr()
+        blocks = []
+        for start in range(0, by_item.shape[0], block_size):
+            block = (by_item[start : start + block_size] @ purchases).tocsr()
+            rows = start + np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+            block.data[block.indices == rows] = 0
+            block.eliminate_zeros()
+            if max_item_neighbors is not None:
+                block = CoOccurrence.__keep_top_per_row(block, max_item_neighbors)
+            blocks.append(block)
+        if len(blocks) == 0:
+            return sp.csr_matrix((0, purchases.shape[1]), dtype=np.float32)
+        return sp.vstack(blocks, format="csr")
+
+    @staticmethod
+    def __keep_top_per_row(matrix: sp.csr_matrix, n: int) -> sp.csr_matrix:
+        keep = np.ones(matrix.nnz, dtype=bool)
+        for row in np.nonzero(np.diff(matrix.indptr) > n)[0]:
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            keep[start:end] = False
+            keep[start + np.argpartition(-matrix.data[start:end], n - 1)[:n]] = True
+        matrix.data[~keep] = 0
+        matrix.eliminate_zeros()
+        return matrix
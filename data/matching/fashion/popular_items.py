@@ -5,10 +5,20 @@ import torch as t
 
 class PopularItemsMatcher(Matcher):
     def __init__(self, k: int):
-        self.popular_items = t.Tensor(
-            t.load("data/derived/most_popular_products.pt")
-        ).to(t.long)
+        self.source_files = ["data/derived/most_popular_products.pt"]
+        self.popular_items = t.Tensor(t.load(self.source_files[0])).to(t.long)
         self.k = k
 
     def get_matches(self, user_id: int) -> t.Tensor:
         return self.popular_items[: self.k]
+
+    def get_matches_batch(self, user_ids: t.Tensor) -> t.Tensor:
+        user_ids = t.as_tensor(user_ids, dtype=t.long)
+        top_k = self.popular_items[: self.k]
+        return t.stack(
+            [
+                t.repeat_interleave(user_ids, top_k.shape[0]),
+                top_k.repeat(user_ids.shape[0]),
+            ],
+            dim=0,
+        )
@@ -1,5 +1,5 @@
 from numpy import dtype
-from ..type import Matcher
+from ..type import Matcher, to_match_edges
 import torch as t
 
 # from typing import Literal
@@ -7,13 +7,31 @@ import torch as t
 
 class UsersSameLocationMatcher(Matcher):
     def __init__(self, k: int, suffix):  # : Literal["train", "test", "val"]
-        self.customers_per_location = t.load("data/derived/customers_per_location.pt")
-        self.location_for_user = t.load("data/derived/location_for_user.pt")
-        self.user_to_articles = t.load(f"data/derived/edges_{suffix}.pt")
+        self.source_files = [
+            "data/derived/customers_per_location.pt",
+            "data/derived/location_for_user.pt",
+            f"data/derived/edges_{suffix}.pt",
+        ]
+        self.customers_per_location = t.load(self.source_files[0])
+        self.location_for_user = t.load(self.source_files[1])
+        self.user_to_articles = t.load(self.source_files[2])
         self.k = k
 
     def get_matches(self, user_id: int) -> t.Tensor:
-        location = self.location_for_user[user_id]
+        return self.get_matches_at(self.location_for_user[user_id])
+
+    def get_matches_batch(self, user_ids: t.Tensor) -> t.Tensor:
+        # The matches only depend on the location, they are computed once per location of the batch
+        user_ids = t.as_tensor(user_ids, dtype=t.long)
+        locations = [self.location_for_user[user_id] for user_id in user_ids.tolist()]
+        matches_at = {
+            location: self.get_matches_at(location) for location in set(locations)
+        }
+        return to_match_edges(
+            user_ids, [matches_at[location] for location in locations]
+        )
+
+    def get_matches_at(self, location) -> t.Tensor:
         customers_at_location = self.customers_per_location[location]
 
         return t.cat(
@@ -1,11 +1,23 @@
 from .type import Matcher
+from data.adjacency import CSRAdjacency
 import torch as t
 
 
 class LightGCNMatcher(Matcher):
     def __init__(self, k: int):  # : Literal["train", "test", "val"]
-        self.top_articles_per_user = t.load("data/derived/lightgcn_output.pt")
+        self.source_files = ["data/derived/lightgcn_output.pt"]
+        self.top_articles_per_user = t.load(self.source_files[0])
         self.k = k
+        # The top k of all customers in one index, for batches
+        self.top_k_per_user = CSRAdjacency.from_dict(
+            {
+                user: t.as_tensor(articles[: self.k]).tolist()
+                for user, articles in self.top_articles_per_user.items()
+            }
+        )
 
     def get_matches(self, user_id: int) -> t.Tensor:
         return self.top_articles_per_user[user_id][: self.k]
+
+    def get_matches_batch(self, user_ids: t.Tensor) -> t.Tensor:
+        return self.top_k_per_user.edges(t.as_tensor(user_ids, dtype=t.long))
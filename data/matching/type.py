@@ -1,10 +1,41 @@
 from abc import ABC
+from typing import List
 import torch as t
 
 
 class Matcher(ABC):
+    # The files the matches are computed from, snapshots of the candidates are rebuilt when one of them changes
+    source_files: List[str] = []
+
     def __init__(self, *args, **kwargs):
         raise NotImplementedError
 
     def get_matches(self, user_id: int) -> t.Tensor:
         raise NotImplementedError
+
+    def get_matches_batch(self, user_ids: t.Tensor) -> t.Tensor:
+        """
+        The matches of a batch of customers as [2, num_matches] (customer, article) edges, every customer
+        has its own number of matches. Falls back to get_matches per customer.
+        """
+        user_ids = t.as_tensor(user_ids, dtype=t.long)
+        matches = [
+            t.as_tensor(self.get_matches(user_id), dtype=t.long)
+            for user_id in user_ids.tolist()
+        ]
+        return to_match_edges(user_ids, matches)
+
+
+def to_match_edges(user_ids: t.Tensor, matches: list) -> t.Tensor:
+    """Ragged list of the matches of every customer -> [2, num_matches] edges"""
+    if len(matches) == 0:
+        return t.empty((2, 0), dtype=t.long)
+    return t.stack(
+        [
+            t.repeat_interleave(
+                user_ids, t.tensor([len(match) for match in matches], dtype=t.long)
+            ),
+            t.cat(matches).to(t.long),
+        ],
+        dim=0,
+    )
@@ -1,26 +1,30 @@
 # from typing import Literal
-from utils.flatten import flatten
-from .type import Matcher
+from .type import Matcher, to_match_edges
+from .cooccurrence import CoOccurrence
+from data.adjacency import CSRAdjacency
 import torch as t
-from torch import Tensor
 
 
 class UsersWithCommonItemsMatcher(Matcher):
+    """The articles most often bought by the customers who bought the same articles as the user"""
+
     def __init__(self, k: int, suffix):  ##: Literal["train", "test", "val"]):
-        self.user_to_articles = t.load(f"data/derived/edges_{suffix}.pt")
-        self.article_to_users = t.load(f"data/derived/rev_edges_{suffix}.pt")
+        self.source_files = [
+            f"data/derived/edges_{suffix}.pt",
+            f"data/derived/rev_edges_{suffix}.pt",
+        ]
+        users = CSRAdjacency.from_dict(t.load(self.source_files[0]))
+        articles = CSRAdjacency.from_dict(t.load(self.source_files[1]))
+        self.co_occurrence = CoOccurrence(
+            users, num_items=max(articles.num_rows, users.num_cols)
+        )
         self.k = k
 
     def get_matches(self, user_id: int) -> t.Tensor:
-        articles_purchased = self.user_to_articles[user_id]
-        users_with_same_articles = flatten(
-            [self.article_to_users[article] for article in articles_purchased]
-        )
-        articles_purchased_by_common_users = t.cat(
-            [
-                t.as_tensor(self.user_to_articles[user])
-                for user in users_with_same_articles
-            ],
-            dim=0,
-        )
-        return articles_purchased_by_common_users[: self.k]
+        return t.from_numpy(self.co_occurrence.top_k([user_id], self.k)[0])
+
+    def get_matches_batch(self, user_ids: t.Tensor) -> t.Tensor:
+        # One sparse product for the whole batch
+        user_ids = t.as_tensor(user_ids, dtype=t.long)
+        matches = self.co_occurrence.top_k(user_ids.numpy(), self.k)
+        return to_match_edges(user_ids, [t.from_numpy(match) for match in matches])
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from functools import lru_cache
+from multiprocessing.managers import BaseManager
+from threading import Lock
+from typing import List, Optional, Tuple
+import torch as t
+from config import Config
+
+# (node_id, n_neighbor, start_neighbor, split_type)
+NeighborhoodKey = Tuple[int, int, int, str]
+
+
+class NeighborhoodCache:
+    """
+    LRU cache of the decoded neighborhoods (edge index per edge type) returned by get_neighborhood,
+    bounded both by the number of entries and by the bytes of the cached tensors.
+    The split graphs don't change during a run, so an entry never goes stale.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict = OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, key: NeighborhoodKey) -> Optional[dict]:
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def get_many(self, keys: List[NeighborhoodKey]) -> List[Optional[dict]]:
+        """Batched get, a single call (round trip to the manager) for a whole batch"""
+        return [self.get(key) for key in keys]
+
+    def put_many(self, items: List[Tuple[NeighborhoodKey, dict]]):
+        for key, neighborhood in items:
+            self.put(key, neighborhood)
+
+    def put(self, key: NeighborhoodKey, neighborhood: dict):
+        size = sum(
+            edge_index.numel() * edge_index.element_size()
+            for edge_index in neighborhood.values()
+            if isinstance(edge_index, t.Tensor)
+        )
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.num_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (neighborhood, size)
+            self.num_bytes += size
+            while (
+                len(self.entries) > self.max_entries or self.num_bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.num_bytes -= evicted_size
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / lookups if lookups > 0 else 0.0,
+                entries=len(self.entries),
+                bytes=self.num_bytes,
+            )
+
+
+class NeighborhoodCacheManager(BaseManager):
+    pass
+
+
+NeighborhoodCacheManager.register("NeighborhoodCache", NeighborhoodCache)
+
+
+@lru_cache(maxsize=None)
+def get_neighborhood_cache(max_entries: int, max_bytes: int, shared: bool):
+    """
+    One cache per process, shared by every split (the split type is part of the key).
+    If `shared`, the cache lives in a manager process and the returned proxy can be handed to DataLoader workers,
+    so a neighborhood fetched by one worker is a hit for all of them.
+    """
+    if not shared:
+        return NeighborhoodCache(max_entries, max_bytes)
+
+    manager = NeighborhoodCacheManager()
+    manager.start()
+    # The proxy keeps a reference to its manager, so the manager process lives as long as the cache
+    return manager.NeighborhoodCache(max_entries, max_bytes)
+
+
+def neighborhood_cache_from_config(
+    config: Config, train: bool = False
+) -> Optional[NeighborhoodCache]:
+    """
+    No cache for the training split when the fan-out is sampled (num_neighbors >= 0): a cached neighborhood
+    would replay its first sample every epoch, instead of drawing new neighbors
+    """
+    if config.neighborhood_cache_entries == 0 or (train and config.num_neighbors >= 0):
+        return None
+    return get_neighborhood_cache(
+        config.neighborhood_cache_entries,
+        config.neighborhood_cache_bytes,
+        # DataLoader workers are separate processes
+        shared=config.num_workers > 0,
+    )
@@ -0,0 +1,349 @@
+import numpy as np
+import torch as t
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, Optional, Tuple
+from torch_geometric.data import HeteroData
+from data.adjacency import CSRAdjacency
+from data.feature_store import load_graph
+from data.sampling import sample_per_group
+from utils.constants import Constants
+
+# Query name and its parameters, answered by run_match instead of being sent to a server
+Query = Tuple[str, dict]
+# Node ids (sorted) and the _id of every node
+IdMapArrays = Tuple[np.ndarray, np.ndarray]
+split_types = ["train", "val", "test"]
+
+
+class InMemoryDatabase:
+    """
+    Embedded, read-only stand-in for Database: answers the same queries from CSR adjacencies of the split graphs.
+    The split graphs are cumulative (val holds the train and val purchases, test holds all of them),
+    which is what the _TRAIN / _VAL / _TEST relationship filter of a split sees in neo4j.
+    """
+
+    def __init__(self, graphs: Dict[str, HeteroData]):
+        self.graphs = graphs
+        # Built upfront, so that they are shared by the dataloader workers
+        self.adjacencies = {
+            split_type: self.__build_adjacencies(graph)
+            for split_type, graph in graphs.items()
+        }
+
+    @staticmethod
+    def from_derived(data_dir: str = "data/derived/") -> "InMemoryDatabase":
+        return InMemoryDatabase(
+            {
+                split_type: load_graph(f"{data_dir}{split_type}_graph.pt")
+                for split_type in split_types
+            }
+        )
+
+    def close(self):
+        pass
+
+    """ GET """
+
+    @staticmethod
+    def query_node(node_id: int, node_type: str) -> Query:
+        return "node", dict(node_id=node_id, node_type=node_type)
+
+    @staticmethod
+    def query_n_neighbors(
+        node_id: int,
+        n_neighbor: int,
+        node_type: str,
+        split_type: str,
+        start_neighbor: int = 0,
+        num_neighbors: Optional[int] = None,
+    ) -> Query:
+        return "n_neighbors", dict(
+            node_ids=[node_id],
+            n_neighbor=n_neighbor,
+            split_type=split_type,
+            start_neighbor=start_neighbor,
+            num_neighbors=num_neighbors,
+        )
+
+    @staticmethod
+    def query_n_neighbors_batch(
+        node_ids: list[int],
+        n_neighbor: int,
+        node_type: str,
+        split_type: str,
+        start_neighbor: int = 0,
+        num_neighbors: Optional[int] = None,
+    ) -> Query:
+        return "n_neighbors_batch", dict(
+            node_ids=node_ids,
+            n_neighbor=n_neighbor,
+            split_type=split_type,
+            start_neighbor=start_neighbor,
+            num_neighbors=num_neighbors,
+        )
+
+    @staticmethod
+    def query_all_nodes(node_type: str) -> Query:
+        return "all_nodes", dict(node_type=node_type)
+
+    """ UTILITY METHODS """
+
+    def run_match(self, query: str, parameters: Optional[dict] = None) -> list:
+        """Returns records shaped like the ones neo4j returns for the same query"""
+        parameters = dict(parameters or dict())
+        if query == "node":
+            return [dict(n=self.__node(parameters["node_id"]))]
+        if query == "all_nodes":
+            num_nodes = self.__any_graph()[parameters["node_type"]].num_nodes
+            return [dict(n=self.__node(i)) for i in range(num_nodes)]
+
+        node_ids = parameters.pop("node_ids")
+        if query == "n_neighbors":
+            return to_edge_columns(self.get_neighborhood(node_ids[0], **parameters))
+        return [
+            dict(id=node_id, **row)
+            for node_id in node_ids
+            for row in to_edge_columns(self.get_neighborhood(node_id, **parameters))
+        ]
+
+    def run_query(self, query: str, parameters: Optional[dict] = None):
+        # Read-only by design, the graphs come from the preprocessed files (eg.: ingest into the neo4j server instead)
+        raise PermissionError("InMemoryDatabase is read-only, it can't run writes")
+
+    def run_write(self, query: str, parameters: Optional[dict] = None):
+        raise PermissionError("InMemoryDatabase is read-only, it can't run writes")
+
+    def create_indexes(self):
+        pass
+
+    def get_neighborhood(
+        self,
+        node_id: int,
+        n_neighbor: int,
+        start_neighbor: int,
+        split_type: str,
+        num_neighbors: Optional[int] = None,
+    ) -> defaultdict:
+        """
+        Same as apoc.path.subgraphAll from a customer: the nodes between start_neighbor and n_neighbor hops away
+        (counting every relationship as one hop, in both directions), and all relationships between them.
+        With num_neighbors it is the fan-out limited expansion of Database.expand_neighbors instead.
+        """
+        if num_neighbors is not None:
+            return self.__sample_neighborhood(
+                node_id, n_neighbor, start_neighbor, split_type, num_neighbors
+            )
+
+        buys = self.__adjacency(split_type, (Constants.node_user, Constants.node_item))
+        bought_by = self.__adjacency(
+            split_type, (Constants.node_item, Constants.node_user)
+        )
+        has_color = self.__adjacency(
+            split_type, (Constants.node_item, Constants.node_extra)
+        )
+        color_of = self.__adjacency(
+            split_type, (Constants.node_extra, Constants.node_item)
+        )
+
+        """ Breadth first search, every node is visited at its shortest distance """
+        empty = t.empty(0, dtype=t.long)
+        frontier = {Constants.node_user: t.tensor([node_id], dtype=t.long)}
+        visited = {Constants.node_user: frontier[Constants.node_user]}
+        in_range = defaultdict(lambda: empty)
+        if start_neighbor == 0:
+            in_range[Constants.node_user] = frontier[Constants.node_user]
+
+        for level in range(1, n_neighbor + 1):
+            reached = defaultdict(list)
+            for (from_type, to_type), adjacency in [
+                ((Constants.node_user, Constants.node_item), buys),
+                ((Constants.node_item, Constants.node_user), bought_by),
+                ((Constants.node_item, Constants.node_extra), has_color),
+                ((Constants.node_extra, Constants.node_item), color_of),
+            ]:
+                if adjacency is not None and from_type in frontier:
+                    reached[to_type].append(adjacency.neighbours(frontier[from_type]))
+
+            frontier = dict()
+            for node_type, pieces in reached.items():
+                nodes = t.cat(pieces).unique()
+                nodes = nodes[~t.isin(nodes, visited.get(node_type, empty))]
+                if nodes.numel() == 0:
+                    continue
+                frontier[node_type] = nodes
+                visited[node_type] = t.cat([visited.get(node_type, empty), nodes])
+                if level >= start_neighbor:
+                    in_range[node_type] = t.cat([in_range[node_type], nodes])
+            if len(frontier) == 0:
+                break
+
+        """ Relationships between the nodes of the subgraph """
+        edge_index = defaultdict(list)
+        for edge_type, adjacency in [
+            (Constants.edge_key, buys),
+            (Constants.edge_key_extra, has_color),
+        ]:
+            if adjacency is None:
+                continue
+            edges = adjacency.edges(in_range[edge_type[0]])
+            edges = edges[:, t.isin(edges[1], in_range[edge_type[2]])]
+            if edges.shape[1] > 0:
+                edge_index[edge_type] = edges
+        return edge_index
+
+    def get_neighborhood_batch(
+        self,
+        node_ids: list[int],
+        n_neighbor: int,
+        start_neighbor: int,
+        split_type: str,
+        num_neighbors: Optional[int] = None,
+    ) -> dict[int, defaultdict]:
+        return {
+            node_id: self.get_neighborhood(
+                node_id, n_neighbor, start_neighbor, split_type, num_neighbors
+            )
+            for node_id in node_ids
+        }
+
+    def __sample_neighborhood(
+        self,
+        node_id: int,
+        n_neighbor: int,
+        start_neighbor: int,
+        split_type: str,
+        num_neighbors: int,
+    ) -> defaultdict:
+        """
+        Every frontier node keeps at most num_neighbors random relationships (of any type) to unvisited nodes per hop,
+        the relationships of hops that start at level start_neighbor or further are returned.
+        """
+        directions = [
+            (Constants.node_user, Constants.node_item, Constants.edge_key, False),
+            (Constants.node_item, Constants.node_user, Constants.edge_key, True),
+            (
+                Constants.node_item,
+                Constants.node_extra,
+                Constants.edge_key_extra,
+                False,
+            ),
+            (Constants.node_extra, Constants.node_item, Constants.edge_key_extra, True),
+        ]
+        empty = t.empty(0, dtype=t.long)
+        frontier = {Constants.node_user: t.tensor([node_id], dtype=t.long)}
+        visited = {Constants.node_user: frontier[Constants.node_user]}
+        edge_index = defaultdict(list)
+
+        for level in range(1, n_neighbor + 1):
+            """Candidate relationships of every frontier node, grouped by the frontier node"""
+            candidates = defaultdict(list)
+            for from_type, to_type, edge_type, reverse in directions:
+                adjacency = self.__adjacency(split_type, (from_type, to_type))
+                if adjacency is None or from_type not in frontier:
+                    continue
+                edges = adjacency.edges(frontier[from_type])
+                edges = edges[:, ~t.isin(edges[1], visited.get(to_type, empty))]
+                candidates[from_type].append((to_type, edge_type, reverse, edges))
+
+            reached = defaultdict(list)
+            for pieces in candidates.values():
+                sources = t.cat([edges[0] for _, _, _, edges in pieces])
+                keep = sample_per_group(sources, num_neighbors).split(
+                    [edges.shape[1] for _, _, _, edges in pieces]
+                )
+                for (to_type, edge_type, reverse, edges), kept in zip(pieces, keep):
+                    edges = edges[:, kept]
+                    reached[to_type].append(edges[1])
+                    if level - 1 >= start_neighbor and edges.shape[1] > 0:
+                        edge_index[edge_type].append(
+                            edges.flip(0) if reverse else edges
+                        )
+
+            frontier = dict()
+            for node_type, pieces in reached.items():
+                nodes = t.cat(pieces).unique()
+                if nodes.numel() == 0:
+                    continue
+                frontier[node_type] = nodes
+                visited[node_type] = t.cat([visited.get(node_type, empty), nodes])
+            if len(frontier) == 0:
+                break
+
+        return defaultdict(
+            list,
+            {
+                edge_type: t.cat(pieces, dim=1).unique(dim=1)
+                for edge_type, pieces in edge_index.items()
+            },
+        )
+
+    def get_id_map(self) -> Tuple[IdMapArrays, IdMapArrays]:
+        graph = self.__any_graph()
+        return tuple(
+            (np.arange(num_nodes, dtype=np.int64), np.arange(num_nodes, dtype=np.int64))
+            for num_nodes in [
+                graph[Constants.node_user].num_nodes,
+                graph[Constants.node_item].num_nodes,
+            ]
+        )
+
+    def __any_graph(self) -> HeteroData:
+        # The splits only differ in their purchases, they have the same nodes
+        return next(iter(self.graphs.values()))
+
+    def __adjacency(
+        self, split_type: str, direction: Tuple[str, str]
+    ) -> Optional[CSRAdjacency]:
+        assert (
+            split_type in self.adjacencies
+        ), f"No graph for the {split_type} split in the in-memory database"
+        return self.adjacencies[split_type].get(direction)
+
+    @staticmethod
+    def __node(node_id: int) -> SimpleNamespace:
+        """Stands in for a neo4j node, with the internal id and the _id property"""
+        return SimpleNamespace(id=node_id, _id=node_id)
+
+    @staticmethod
+    def __build_adjacencies(
+        graph: HeteroData,
+    ) -> Dict[Tuple[str, str], CSRAdjacency]:
+        edges = {
+            (Constants.node_user, Constants.node_item): graph[
+                Constants.edge_key
+            ].edge_index
+        }
+        # create_data_pyg stores the [article, colour] edges under (colour, has_color, article)
+        for edge_type in graph.edge_types:
+            if edge_type[1] == Constants.rel_type_extra:
+                edges[(Constants.node_item, Constants.node_extra)] = graph[
+                    edge_type
+                ].edge_index
+
+        num_nodes = {
+            node_type: graph[node_type].num_nodes for node_type in graph.node_types
+        }
+        adjacencies = dict()
+        for (from_type, to_type), edge_index in edges.items():
+            for (rows, cols), index in [
+                ((from_type, to_type), edge_index),
+                ((to_type, from_type), edge_index.flip(0)),
+            ]:
+                adjacencies[(rows, cols)] = CSRAdjacency.from_edge_index(
+                    index, num_rows=num_nodes[rows], num_cols=num_nodes[cols]
+                ).share_memory_()
+        return adjacencies
+
+
+def to_edge_columns(neighborhood: dict) -> list:
+    """Edge indexes back to the edge_type, from_ids, to_ids rows of Database.return_edge_columns"""
+    return [
+        dict(
+            edge_type=list(edge_type),
+            from_ids=edge_index[0].tolist(),
+            to_ids=edge_index[1].tolist(),
+        )
+        for edge_type, edge_index in neighborhood.items()
+        if edge_index.numel() > 0
+    ]
@@ -0,0 +1,186 @@
+import time
+from typing import List, Optional
+import pandas as pd
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+from data.neo4j.neo4j_database import Database, Query
+from data.neo4j.save import split_relationship_types, transaction_keys
+from utils.constants import Constants
+
+split_types = [
+    f"{Constants.rel_type}_TRAIN",
+    f"{Constants.rel_type}_VAL",
+    f"{Constants.rel_type}_TEST",
+]
+retryable_errors = (TransientError, ServiceUnavailable, SessionExpired)
+
+
+def ingest_to_neo4j(
+    db: Database,
+    customers: Optional[pd.DataFrame],
+    articles: Optional[pd.DataFrame],
+    transactions: pd.DataFrame,
+    extra_nodes: Optional[pd.DataFrame] = None,
+    extra_node_name: Optional[str] = None,
+    extra_edges: Optional[pd.DataFrame] = None,
+    extra_edge_type_label: Optional[str] = None,
+    batch_size: int = 10_000,
+    max_retries: int = 3,
+):
+    """
+    Incremental counterpart of save_to_neo4j: merges new nodes and the purchases (same dataframes)
+    into the running database, in batched UNWIND write transactions of batch_size rows.
+    Like the bulk import, every transaction is its own relationship, keyed by its `tx` (see transaction_keys):
+    a repeat purchase adds one, a transaction already in the database under another split type is retyped in place,
+    and ingesting the same feed twice changes nothing.
+    """
+    for node_type in [Constants.node_user, Constants.node_item, extra_node_name]:
+        if node_type is not None:
+            # MERGE looks the nodes up by _id
+            db.run_query(*query_create_id_index(node_type))
+
+    for node_type, nodes in [
+        (Constants.node_user, customers),
+        (Constants.node_item, articles),
+        (extra_node_name, extra_nodes),
+    ]:
+        if nodes is not None:
+            print(f"| Merging {len(nodes)} {node_type} nodes...")
+            write_in_batches(
+                db,
+                query_merge_nodes(node_type),
+                to_node_rows(nodes),
+                batch_size,
+                max_retries,
+            )
+
+    if extra_edges is not None:
+        print(f"| Merging {len(extra_edges)} {extra_edge_type_label} relationships...")
+        write_in_batches(
+            db,
+            query_merge_extra_relationships(extra_node_name, extra_edge_type_label),
+            extra_edges.astype(int)
+            .rename(
+                columns={
+                    f"{Constants.node_item}_id": "from_id",
+                    f"{extra_node_name}_id": "to_id",
+                }
+            )[["from_id", "to_id"]]
+            .to_dict("records"),
+            batch_size,
+            max_retries,
+        )
+
+    transactions = transactions.astype(
+        {"train_mask": int, "val_mask": int, "test_mask": int}
+    )
+    relationship_types = split_relationship_types(transactions)
+    for relationship_type in split_types:
+        purchases = transactions[relationship_types == relationship_type]
+        if len(purchases) == 0:
+            continue
+        print(f"| Merging {len(purchases)} {relationship_type} relationships...")
+        write_in_batches(
+            db,
+            query_merge_purchases(relationship_type),
+            to_purchase_rows(purchases),
+            batch_size,
+            max_retries,
+        )
+
+
+def write_in_batches(
+    db: Database,
+    query: Query,
+    rows: List[dict],
+    batch_size: int,
+    max_retries: int,
+    retry_delay: float = 1.0,
+):
+    """
+    Every batch is its own transaction, a failed batch is retried (with exponential backoff) without redoing the others,
+    after the retries of run_write ran out. The queries are MERGEs, so re-running a batch whose commit went through
+    (the connection dropped before the acknowledgement) doesn't duplicate anything.
+    """
+    template, parameters = query
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start : start + batch_size]
+        for attempt in range(max_retries + 1):
+            try:
+                db.run_write(template, dict(parameters, rows=batch))
+                break
+            except retryable_errors:
+                if attempt == max_retries:
+                    raise
+                time.sleep(retry_delay * 2**attempt)
+
+
+def to_node_rows(nodes: pd.DataFrame) -> List[dict]:
+    """_id (the index column, like save_to_neo4j) and the other columns as properties"""
+    ids = nodes["index"].astype(int).tolist()
+    properties = nodes.drop(columns=["index"]).to_dict("records")
+    return [dict(_id=_id, properties=row) for _id, row in zip(ids, properties)]
+
+
+def to_purchase_rows(transactions: pd.DataFrame) -> List[dict]:
+    return [
+        dict(
+            tx=tx,
+            customer_id=customer_id,
+            article_id=article_id,
+            properties=dict(train_mask=train, val_mask=val, test_mask=test),
+        )
+        for tx, customer_id, article_id, train, val, test in zip(
+            transaction_keys(transactions).tolist(),
+            *(
+                transactions[column].astype(int).tolist()
+                for column in [
+                    f"{Constants.node_user}_id",
+                    f"{Constants.node_item}_id",
+                    "train_mask",
+                    "val_mask",
+                    "test_mask",
+                ]
+            ),
+        )
+    ]
+
+
+def query_create_id_index(node_type: str) -> Query:
+    return f"CREATE INDEX IF NOT EXISTS FOR (n:{node_type}) ON (n._id)", dict()
+
+
+def query_merge_nodes(node_type: str) -> Query:
+    return (
+        f"UNWIND $rows AS row MERGE (n:{node_type} {{_id: row._id}}) SET n += row.properties",
+        dict(),
+    )
+
+
+def query_merge_purchases(relationship_type: str) -> Query:
+    """
+    One relationship per transaction, merged on its tx (the type is part of the template, MERGE needs a static type).
+    The relationship of the transaction under another split type is replaced, its properties carried over.
+    """
+    return (
+        "UNWIND $rows AS row"
+        + f" MATCH (c:{Constants.node_user} {{_id: row.customer_id}}), (a:{Constants.node_item} {{_id: row.article_id}})"
+        + " OPTIONAL MATCH (c)-[old {tx: row.tx}]->(a) WHERE type(old) IN $other_types"
+        + " WITH c, a, row, collect(old) AS retyped"
+        + f" MERGE (c)-[r:{relationship_type} {{tx: row.tx}}]->(a)"
+        + " FOREACH (old IN retyped | SET r += properties(old) DELETE old)"
+        + " SET r += row.properties",
+        dict(
+            other_types=[other for other in split_types if other != relationship_type]
+        ),
+    )
+
+
+def query_merge_extra_relationships(
+    extra_node_name: str, extra_edge_type_label: str
+) -> Query:
+    return (
+        "UNWIND $rows AS row"
+        + f" MATCH (a:{Constants.node_item} {{_id: row.from_id}}), (e:{extra_node_name} {{_id: row.to_id}})"
+        + f" MERGE (a)-[:{extra_edge_type_label}]->(e)",
+        dict(),
+    )
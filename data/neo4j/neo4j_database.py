@@ -1,27 +1,50 @@
-from neo4j import GraphDatabase
-from typing import Optional
+from neo4j import GraphDatabase, Session
+from typing import Iterator, Optional, Tuple
+from contextlib import contextmanager
+from queue import LifoQueue
+from threading import Lock
 from utils.constants import Constants
 
 query_periodic_commit = "USING PERIODIC COMMIT 10000 "
+# Query template and its parameters
+Query = Tuple[str, dict]
 
 
 class Database:
-    def __init__(self, uri: str, user: str, password: str):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    """
+    Queries are templates with $parameters, so every call of the same query reuses one cached plan.
+    Reads run in explicit read transactions on a bounded pool of long-lived sessions.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        user: str,
+        password: str,
+        pool_size: int = 4,
+        fetch_size: int = 1000,
+    ):
+        self.driver = GraphDatabase.driver(
+            uri, auth=(user, password), max_connection_pool_size=pool_size
+        )
+        self.pool_size = pool_size
+        self.fetch_size = fetch_size  # records pulled from the server per round trip
+        self.sessions: LifoQueue = LifoQueue(maxsize=pool_size)
+        self.num_sessions = 0
+        self.lock = Lock()
 
     def close(self):
+        while not self.sessions.empty():
+            self.sessions.get_nowait().close()
         self.driver.close()
 
     """ GET """
 
     @staticmethod
-    def query_node(node_id: int, node_type: str, no_return: bool = False) -> str:
-        query = f"MATCH(n:{node_type} {{_id:'{str(node_id)}'}})"
-
-        if no_return:
-            return query + " "
-        else:
-            return query + " RETURN n"
+    def query_node(node_id: int, node_type: str) -> Query:
+        return f"MATCH (n:{node_type} {{_id: $node_id}}) RETURN n", dict(
+            node_id=int(node_id)
+        )
 
     @staticmethod
     def query_n_neighbors(
@@ -30,9 +53,106 @@ class Database:
         node_type: str,
         split_type: str,
         start_neighbor: int = 0,
-        no_return: bool = False,
+        num_neighbors: Optional[int] = None,
+    ) -> Query:
+        query = (
+            f"MATCH (p:{node_type} {{_id: $node_id}})"
+            + Database.expand_neighbors(n_neighbor, num_neighbors)
+            + Database.return_edge_columns()
+        )
+        return query, dict(
+            node_id=int(node_id),
+            **Database.neighbors_parameters(
+                n_neighbor, split_type, start_neighbor, num_neighbors
+            ),
+        )
+
+    @staticmethod
+    def query_n_neighbors_batch(
+        node_ids: list[int],
+        n_neighbor: int,
+        node_type: str,
+        split_type: str,
+        start_neighbor: int = 0,
+        num_neighbors: Optional[int] = None,
+    ) -> Query:
+        """Same as query_n_neighbors for every id in `node_ids`, the rows also have the id they belong to"""
+        query = (
+            f"UNWIND $ids AS id MATCH (p:{node_type} {{_id: id}})"
+            + Database.expand_neighbors(n_neighbor, num_neighbors, carry="id, ")
+            + Database.return_edge_columns(carry="id, ")
+        )
+        return query, dict(
+            ids=node_ids,
+            **Database.neighbors_parameters(
+                n_neighbor, split_type, start_neighbor, num_neighbors
+            ),
+        )
+
+    @staticmethod
+    def expand_neighbors(
+        n_neighbor: int, num_neighbors: Optional[int], carry: str = ""
     ) -> str:
+        """
+        Expands from `p` into `relationships`.
+        Without num_neighbors it is the whole n-hop subgraph (apoc.path.subgraphAll), otherwise every frontier node
+        keeps at most num_neighbors random relationships to unvisited nodes per hop,
+        so the result is bounded by num_neighbors^n_neighbor relationships.
+        """
+        if num_neighbors is None:
+            return (
+                " CALL apoc.path.subgraphAll(p, {relationshipFilter: $relationship_filter, minLevel: $min_level, maxLevel: $max_level})"
+                + " YIELD relationships"
+            )
+
+        query = f" WITH {carry}[p] AS frontier, [p] AS visited, [] AS relationships"
+        # Cypher has no loops, the hops are unrolled (one template per number of hops)
+        for hop in range(1, n_neighbor + 1):
+            query += (
+                " CALL { WITH frontier, visited UNWIND frontier AS f"
+                + " CALL { WITH f, visited MATCH (f)-[r]-(m) WHERE type(r) IN $relationship_types AND NOT m IN visited"
+                + " WITH r, m ORDER BY rand() LIMIT $num_neighbors RETURN r, m }"
+                + " RETURN collect(r) AS hop_relationships, collect(DISTINCT m) AS hop_nodes }"
+                # The relationships of a hop are between levels hop - 1 and hop, both have to be at least min_level
+                + f" WITH {carry}hop_nodes AS frontier, visited + hop_nodes AS visited,"
+                + f" relationships + CASE WHEN {hop - 1} >= $min_level THEN hop_relationships ELSE [] END AS relationships"
+            )
+        return query
+
+    @staticmethod
+    def return_edge_columns(carry: str = "") -> str:
+        """
+        One row per relationship type of `relationships`: the [from_type, rel_type, to_type] edge_type
+        and the integer _id columns from_ids and to_ids, instead of a list per relationship.
+        """
+        return (
+            " UNWIND relationships AS r"
+            + f" WITH {carry}[LABELS(STARTNODE(r))[0], TYPE(r), LABELS(ENDNODE(r))[0]] AS edge_type,"
+            + " STARTNODE(r)._id AS from_id, ENDNODE(r)._id AS to_id"
+            + f" RETURN {carry}edge_type, collect(from_id) AS from_ids, collect(to_id) AS to_ids"
+        )
+
+    @staticmethod
+    def neighbors_parameters(
+        n_neighbor: int,
+        split_type: str,
+        start_neighbor: int,
+        num_neighbors: Optional[int] = None,
+    ) -> dict:
+        relationship_filter = Database.relationship_filter(split_type)
+        parameters = dict(
+            relationship_filter=relationship_filter,
+            min_level=start_neighbor,
+            max_level=n_neighbor,
+        )
+        if num_neighbors is not None:
+            parameters["relationship_types"] = relationship_filter.split("|")
+            parameters["num_neighbors"] = num_neighbors
+        return parameters
 
+    @staticmethod
+    def relationship_filter(split_type: str) -> str:
+        """The relationships a split can see: val sees train, test sees train and val"""
         base = f"{Constants.rel_type}_TRAIN"
         extension = (
             f"|{Constants.rel_type}_VAL"
@@ -42,40 +162,98 @@ class Database:
             else ""
         )
         extra = f"|{Constants.rel_type_extra}"
-        rel_string = base + extension + extra
+        return base + extension + extra
 
-        query = (
-            f"MATCH (p:{node_type} {{_id: '{str(node_id)}'}}) "
-            + f" CALL apoc.path.subgraphAll(p, {{relationshipFilter: '{rel_string}', minLevel: {str(start_neighbor)}, maxLevel: {str(n_neighbor)}}})"
-            + f" YIELD relationships"
-            + f" RETURN [r in relationships | [LABELS(STARTNODE(r))[0],TYPE(r),LABELS(ENDNODE(r))[0], STARTNODE(r)._id,ENDNODE(r)._id]] as arraysomething"
+    @staticmethod
+    def query_all_nodes(node_type: str) -> Query:
+        return f"MATCH (n:{node_type}) RETURN n", dict()
+
+    @staticmethod
+    def query_id_page(node_type: str, after: int, page_size: int) -> Query:
+        """
+        The next page_size (node id, _id) pairs after node id `after`, as two columns of a single row.
+        Keyset pagination on the node id, every page is an index seek instead of skipping the previous pages.
+        """
+        return (
+            f"MATCH (n:{node_type}) WHERE id(n) > $after"
+            + " WITH n ORDER BY id(n) LIMIT $page_size"
+            + " RETURN collect(id(n)) AS ids, collect(n._id) AS _ids",
+            dict(after=after, page_size=page_size),
         )
 
-        if no_return:
-            return query + " "
-        else:
-            return query + " RETURN relationships"
+    @staticmethod
+    def query_id_type(node_type: str) -> Query:
+        return f"MATCH (n:{node_type}) RETURN n._id AS _id LIMIT 1", dict()
+
+    """ UTILITY METHODS """
+
+    def check_id_type(self):
+        """
+        Databases imported before _id was stored as an integer (_id:long) have string _ids,
+        the integer ids of the queries would silently match none of them
+        """
+        self.check_id_records(self.run_match(*self.query_id_type(Constants.node_user)))
 
     @staticmethod
-    def query_all_nodes(node_type: str) -> str:
-        query = f"MATCH (n:{node_type}) RETURN n"
+    def check_id_records(records: list):
+        """Raises on the string _id of the records of query_id_type"""
+        if len(records) > 0 and isinstance(records[0]["_id"], str):
+            raise TypeError(
+                "The _id of the nodes are strings, the database was imported before _id became an integer."
+                + " Reimport it (preprocessing with save_to_neo4j = True)."
+            )
 
-        return query
+    def run_match(self, query: str, parameters: Optional[dict] = None) -> list:
+        """Runs a read query in a read transaction, returns all records"""
 
-    """ UTILITY METHODS """
+        def read(tx) -> list:
+            return list(tx.run(query, parameters))
 
-    def run_match(self, query: str):
-        with self.driver.session() as session:
-            result = list(session.run(query))
+        with self.session() as session:
+            # execute_read replaced read_transaction in the 5.x driver
+            if hasattr(session, "execute_read"):
+                return session.execute_read(read)
+            return session.read_transaction(read)
 
-            return result
+    def run_write(self, query: str, parameters: Optional[dict] = None) -> list:
+        """Runs a write query in a write transaction (retried by the driver on transient errors), returns all records"""
 
-    def run_query(self, query: str):
-        with self.driver.session() as session:
-            info = session.run(query)
+        def write(tx) -> list:
+            return list(tx.run(query, parameters))
+
+        with self.session() as session:
+            if hasattr(session, "execute_write"):
+                return session.execute_write(write)
+            return session.write_transaction(write)
+
+    def run_query(self, query: str, parameters: Optional[dict] = None) -> list:
+        with self.session() as session:
+            info = session.run(query, parameters)
             print(info)
             return list(info)
 
+    @contextmanager
+    def session(self) -> Iterator[Session]:
+        """Borrows a session from the pool, opening a new one while there are less than pool_size"""
+        with self.lock:
+            create = self.sessions.empty() and self.num_sessions < self.pool_size
+            if create:
+                self.num_sessions += 1
+        session = (
+            self.driver.session(fetch_size=self.fetch_size)
+            if create
+            else self.sessions.get()
+        )
+
+        try:
+            yield session
+        except Exception:
+            # The session may be in a broken state, a new one takes its place in the pool
+            session.close()
+            self.sessions.put(self.driver.session(fetch_size=self.fetch_size))
+            raise
+        self.sessions.put(session)
+
     def clear(self):
         query = "MATCH (n) DETACH DELETE n"
         self.run_query(query)
@@ -0,0 +1,168 @@
+import asyncio
+import itertools
+import math
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+import torch as t
+from neo4j import AsyncDriver, AsyncGraphDatabase
+from torch.utils.data import Sampler
+from torch_geometric.data import Batch
+from data.neo4j.neo4j_database import Database
+from data.neo4j.utils import cache_neighborhoods, cached_neighborhoods, to_neighborhoods
+from utils.constants import Constants
+
+
+class AsyncPrefetchLoader:
+    """
+    Loader for the neo4j dataset that keeps `in_flight` batches of neighborhood queries running on the async driver
+    while the model trains on the current batch.
+    The event loop only awaits the queries, decoding the records and collating the batches runs in a worker thread.
+    The next batch is only queried once the oldest one is taken, so a slow consumer never has more than `in_flight` batches waiting.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        batch_size: int = 1,
+        shuffle: bool = True,
+        in_flight: int = 4,
+        batch_sampler: Optional[Sampler] = None,
+    ):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.in_flight = in_flight
+        self.batch_sampler = batch_sampler
+
+    def __len__(self) -> int:
+        if self.batch_sampler is not None:
+            return len(self.batch_sampler)
+        return math.ceil(len(self.dataset) / self.batch_size)
+
+    def __iter__(self) -> Iterator[Batch]:
+        # The event loop (and the driver bound to it) lives in a background thread for the duration of the epoch
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        driver = asyncio.run_coroutine_threadsafe(self.__open_driver(), loop).result()
+        collate = ThreadPoolExecutor(max_workers=1)
+
+        if self.batch_sampler is not None:
+            batches = iter(self.batch_sampler)
+        else:
+            order = (
+                t.randperm(len(self.dataset))
+                if self.shuffle
+                else t.arange(len(self.dataset))
+            )
+            batches = (user_ids.tolist() for user_ids in order.split(self.batch_size))
+
+        def submit(user_ids: List[int]) -> Future:
+            return asyncio.run_coroutine_threadsafe(
+                self.__sample_batch(driver, collate, user_ids), loop
+            )
+
+        pending = deque()
+        try:
+            asyncio.run_coroutine_threadsafe(
+                self.__check_id_type(driver), loop
+            ).result()
+            pending.extend(
+                submit(user_ids)
+                for user_ids in itertools.islice(batches, self.in_flight)
+            )
+            while len(pending) > 0:
+                data = pending.popleft().result()
+                # Refill before handing the batch over, so the queries overlap with training on it
+                user_ids = next(batches, None)
+                if user_ids is not None:
+                    pending.append(submit(user_ids))
+                yield data
+        finally:
+            for future in pending:
+                future.cancel()
+            asyncio.run_coroutine_threadsafe(driver.close(), loop).result()
+            collate.shutdown(cancel_futures=True)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    async def __open_driver(self) -> AsyncDriver:
+        uri, user, password = self.dataset.db_param
+        return AsyncGraphDatabase.driver(
+            uri, auth=(user, password), max_connection_pool_size=self.in_flight
+        )
+
+    async def __sample_batch(
+        self, driver: AsyncDriver, collate: ThreadPoolExecutor, user_ids: List[int]
+    ) -> Batch:
+        n_neighbor, split_type = (
+            self.dataset.config.n_hop_neighbors,
+            self.dataset.split_type,
+        )
+        cache = self.dataset.neighborhood_cache
+        neighborhoods, missing_ids = dict(), user_ids
+        if cache is not None:
+            neighborhoods, missing_ids = cached_neighborhoods(
+                cache, user_ids, n_neighbor, 1, split_type
+            )
+        records = (
+            await self.__fetch_records(driver, missing_ids)
+            if len(missing_ids) > 0
+            else []
+        )
+
+        # CPU-bound, off the event loop so that the other in-flight queries keep being served
+        fetched, batch = await asyncio.get_running_loop().run_in_executor(
+            collate, self.__build_batch, user_ids, neighborhoods, missing_ids, records
+        )
+        # The cache is only touched from the event loop thread
+        if cache is not None:
+            cache_neighborhoods(cache, fetched, n_neighbor, 1, split_type)
+        return batch
+
+    def __build_batch(
+        self,
+        user_ids: List[int],
+        neighborhoods: dict,
+        missing_ids: List[int],
+        records: list,
+    ) -> Tuple[dict, Batch]:
+        fetched = to_neighborhoods(missing_ids, records)
+        return fetched, self.dataset.create_batch(
+            user_ids, {**neighborhoods, **fetched}
+        )
+
+    async def __check_id_type(self, driver: AsyncDriver):
+        """Database.check_id_type on the async driver"""
+        Database.check_id_records(
+            await self.__read(driver, *Database.query_id_type(Constants.node_user))
+        )
+
+    async def __fetch_records(self, driver: AsyncDriver, user_ids: List[int]) -> list:
+        return await self.__read(
+            driver,
+            *Database.query_n_neighbors_batch(
+                node_ids=user_ids,
+                n_neighbor=self.dataset.config.n_hop_neighbors,
+                node_type=Constants.node_user,
+                split_type=self.dataset.split_type,
+                start_neighbor=1,
+                num_neighbors=self.dataset.num_neighbors,
+            ),
+        )
+
+    async def __read(self, driver: AsyncDriver, query: str, parameters: dict) -> list:
+        async def read(tx) -> list:
+            result = await tx.run(query, parameters)
+            return [record async for record in result]
+
+        async with driver.session(
+            fetch_size=self.dataset.config.neo4j_fetch_size
+        ) as session:
+            # execute_read replaced read_transaction in the 5.x driver
+            if hasattr(session, "execute_read"):
+                return await session.execute_read(read)
+            return await session.read_transaction(read)
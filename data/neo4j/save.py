@@ -3,13 +3,110 @@ import os
 import time
 from utils.pandas import drop_columns_if_exist
 import numpy as np
-from typing import Optional, Tuple
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
 import torch as t
 from utils.constants import Constants
 
+csv_chunk_size = 1_000_000  # rows formatted and written at a time
+csv_part_size = 2_000_000  # rows of a part file, written by one process
 
-def save_to_csv(dataframe: pd.DataFrame, name: str):
-    dataframe.to_csv(f"data/saved/{name}.csv", index=False)
+# The dataframes being exported, inherited by the forked processes (the dataframes are never pickled)
+__exported_dataframes: Dict[str, pd.DataFrame] = dict()
+
+
+def save_to_csv(
+    dataframe: pd.DataFrame,
+    name: str,
+    header: bool = True,
+    compress: bool = False,
+    chunk_size: int = csv_chunk_size,
+) -> str:
+    """Streams the csv in chunks of chunk_size rows (gzipped if compress, neo4j-admin import reads .csv.gz as well)"""
+    path = f"data/saved/{name}.csv" + (".gz" if compress else "")
+    dataframe.to_csv(
+        path,
+        index=False,
+        header=header,
+        chunksize=chunk_size,
+        compression="gzip" if compress else None,
+    )
+    return path
+
+
+def save_all_to_csv(
+    dataframes: Dict[str, pd.DataFrame],
+    compress: bool = False,
+    part_size: int = csv_part_size,
+    num_processes: Optional[int] = None,
+) -> Dict[str, str]:
+    """
+    Writes every dataframe as a header file and part files of part_size rows, returns the files of every dataframe
+    the way neo4j-admin import takes them ("header,part_0,part_1,...").
+    Formatting the csv holds the GIL, so the parts are written by forked processes, which inherit the dataframes
+    and only receive the row range of their part (the parts are written one by one where fork is not available).
+    """
+    parts = [(name, f"{name}_header", 0, 0, True) for name in dataframes] + [
+        (name, f"{name}_{start // part_size}", start, start + part_size, False)
+        for name, dataframe in dataframes.items()
+        for start in range(0, len(dataframe), part_size)
+    ]
+    __exported_dataframes.update(dataframes)
+    try:
+        if "fork" in multiprocessing.get_all_start_methods():
+            with multiprocessing.get_context("fork").Pool(num_processes) as pool:
+                paths = pool.starmap(
+                    __save_rows, [part + (compress,) for part in parts]
+                )
+        else:
+            paths = [__save_rows(*part, compress) for part in parts]
+    finally:
+        __exported_dataframes.clear()
+
+    files: Dict[str, List[str]] = {name: [] for name in dataframes}
+    for (name, *_), path in zip(parts, paths):
+        files[name].append(path)
+    return {name: ",".join(paths) for name, paths in files.items()}
+
+
+def __save_rows(
+    name: str, file_name: str, start: int, stop: int, header: bool, compress: bool
+) -> str:
+    return save_to_csv(
+        __exported_dataframes[name].iloc[start:stop], file_name, header, compress
+    )
+
+
+def split_relationship_types(transactions: pd.DataFrame) -> np.ndarray:
+    """buys_TEST, buys_VAL or buys_TRAIN for every transaction, from its split masks"""
+    return np.select(
+        [transactions["test_mask"] == 1, transactions["val_mask"] == 1],
+        [f"{Constants.rel_type}_TEST", f"{Constants.rel_type}_VAL"],
+        default=f"{Constants.rel_type}_TRAIN",
+    )
+
+
+def transaction_keys(transactions: pd.DataFrame) -> pd.Series:
+    """
+    Identity of every transaction, the `tx` property of its relationship (shared by the bulk import and the ingestion):
+    customer, article, day of the purchase (when known) and the number of identical purchases before it,
+    so a repeat purchase is a transaction of its own. A `tx` column is taken as it is.
+    """
+    if "tx" in transactions:
+        return transactions["tx"].astype(str)
+    columns = [
+        transactions[f"{Constants.node_user}_id"].astype(int),
+        transactions[f"{Constants.node_item}_id"].astype(int),
+    ]
+    if "t_dat" in transactions:
+        columns.append(pd.to_datetime(transactions["t_dat"]).dt.strftime("%Y-%m-%d"))
+    elif "timestamp" in transactions:
+        columns.append(transactions["timestamp"].astype(int))
+    occurrence = pd.concat(columns, axis=1).groupby(columns).cumcount()
+    keys = columns[0].astype(str)
+    for column in columns[1:] + [occurrence]:
+        keys = keys + "-" + column.astype(str)
+    return keys
 
 
 def save_to_neo4j(
@@ -20,24 +117,28 @@ def save_to_neo4j(
     extra_node_name: Optional[str],
     extra_edges: Optional[pd.DataFrame],
     extra_edge_type_label: Optional[str],
+    compress: bool = False,
 ):
     print("| Saving to neo4j...")
+    nodes, relationships = dict(), dict()
     print("| Processing customer nodes...")
     customers = customers.copy()
     customers[":LABEL"] = Constants.node_user
     customers.rename(columns={"index": f":ID({Constants.node_user})"}, inplace=True)
-    customers["_id"] = customers[f":ID({Constants.node_user})"]
-    save_to_csv(customers, "customers")
+    # Typed column, so that _id is stored as an integer (queried with integer ids)
+    customers["_id:long"] = customers[f":ID({Constants.node_user})"]
+    nodes["customers"] = customers
 
     print("| Processing article nodes...")
     articles = articles.copy()
     articles[":LABEL"] = Constants.node_item
     articles.rename(columns={"index": f":ID({Constants.node_item})"}, inplace=True)
-    articles["_id"] = articles[f":ID({Constants.node_item})"]
-    save_to_csv(articles, "articles")
+    articles["_id:long"] = articles[f":ID({Constants.node_item})"]
+    nodes["articles"] = articles
 
     print("| Renaming transactions...")
     transactions = transactions.copy()
+    transactions["tx"] = transaction_keys(transactions)
     transactions.rename(
         columns={
             f"{Constants.node_user}_id": f":START_ID({Constants.node_user})",
@@ -51,9 +152,9 @@ def save_to_neo4j(
         extra_node_df = pd.DataFrame(data=extra_nodes.copy())
         extra_node_df[":LABEL"] = extra_node_name
         extra_node_df.rename(columns={"index": f":ID({extra_node_name})"}, inplace=True)
-        extra_node_df["_id"] = extra_node_df[f":ID({extra_node_name})"]
+        extra_node_df["_id:long"] = extra_node_df[f":ID({extra_node_name})"]
         extra_node_df = extra_node_df.astype(str)
-        save_to_csv(extra_node_df, f"{extra_node_name}")
+        nodes[f"{extra_node_name}"] = extra_node_df
         new_extra_edges = extra_edges.copy()
         new_extra_edges.rename(
             columns={
@@ -64,7 +165,7 @@ def save_to_neo4j(
         )
         new_extra_edges = new_extra_edges.astype(int)
         new_extra_edges[":TYPE"] = extra_edge_type_label
-        save_to_csv(new_extra_edges, "extra_transactions")
+        relationships["extra_transactions"] = new_extra_edges
 
     transactions = drop_columns_if_exist(
         transactions, ["t_dat", "price", "sales_channel_id", "year-month"]
@@ -75,28 +176,22 @@ def save_to_neo4j(
     transactions["val_mask"] = transactions["val_mask"].astype(int)
 
     print("| Changing the edge names...")
-    transactions[":TYPE"] = transactions.apply(
-        lambda x: f"{Constants.rel_type}_TEST"
-        if x["test_mask"] == 1
-        else f"{Constants.rel_type}_VAL"
-        if x["val_mask"] == 1
-        else f"{Constants.rel_type}_TRAIN",
-        axis=1,
-    )
+    transactions[":TYPE"] = split_relationship_types(transactions)
+    relationships["transactions"] = transactions
 
-    save_to_csv(transactions, "transactions")
+    print("| Writing csv files...")
+    paths = save_all_to_csv({**nodes, **relationships}, compress)
     # Neo4j needs to be stopped for neo4j-admin import to run
     print("| Stopping running instances of Neo4j...")
     os.system("neo4j stop")
     print("| Importing csv to database...")
-    if extra_nodes is not None:
-        os.system(
-            f"neo4j-admin import --database=neo4j --nodes=data/saved/articles.csv --nodes=data/saved/customers.csv --nodes=data/saved/{extra_node_name}.csv --relationships=data/saved/transactions.csv --relationships=data/saved/extra_transactions.csv --force"
-        )
-    else:
-        os.system(
-            f"neo4j-admin import --database=neo4j --nodes=data/saved/articles.csv --nodes=data/saved/customers.csv --relationships=data/saved/transactions.csv --force"
-        )
+    os.system(
+        "neo4j-admin import --database=neo4j "
+        + " ".join(f"--nodes={paths[name]}" for name in nodes)
+        + " "
+        + " ".join(f"--relationships={paths[name]}" for name in relationships)
+        + " --force"
+    )
 
     print("| Starting Neo4j...")
     os.system("neo4j start")
@@ -1,50 +1,193 @@
 from neo4j.graph import Node, Relationship
 from data.neo4j.neo4j_database import Database
 from utils.constants import Constants
+from data.neo4j.in_memory_database import IdMapArrays, InMemoryDatabase
+from data.neo4j.cache import NeighborhoodCache
 from collections import defaultdict
+from typing import Optional, Union
+import numpy as np
 import torch as t
 
 
 def get_neighborhood(
-    db: Database, node_id: int, n_neighbor: int, start_neighbor: int, split_type: str
+    db: Union[Database, InMemoryDatabase],
+    node_id: int,
+    n_neighbor: int,
+    start_neighbor: int,
+    split_type: str,
+    cache: Optional[NeighborhoodCache] = None,
+    num_neighbors: Optional[int] = None,
 ) -> defaultdict:
-    result = db.run_match(
-        db.query_n_neighbors(
-            node_id=node_id,
-            n_neighbor=n_neighbor,
-            node_type="customer",
-            split_type=split_type,
-            start_neighbor=start_neighbor,
-            no_return=True,
+    """
+    Edge index per edge type of the neighborhood of a customer.
+    With num_neighbors, every node keeps at most num_neighbors random neighbors per hop (sampled by the database),
+    a cached neighborhood keeps the sample it was first fetched with (training datasets don't cache sampled neighborhoods).
+    """
+    key = (node_id, n_neighbor, start_neighbor, split_type)
+    if cache is not None:
+        neighborhood = cache.get(key)
+        if neighborhood is not None:
+            return neighborhood
+
+    if isinstance(db, InMemoryDatabase):
+        # Answered straight from the adjacency arrays, without going through records
+        neighborhood = db.get_neighborhood(
+            node_id, n_neighbor, start_neighbor, split_type, num_neighbors
         )
-    )
+    else:
+        result = db.run_match(
+            *db.query_n_neighbors(
+                node_id=node_id,
+                n_neighbor=n_neighbor,
+                node_type="customer",
+                split_type=split_type,
+                start_neighbor=start_neighbor,
+                num_neighbors=num_neighbors,
+            )
+        )
+        neighborhood = __to_edge_index(result)
+
+    if cache is not None:
+        cache.put(key, neighborhood)
+    return neighborhood
 
-    """ Filter nodes and experiments into lists """
-    edge_index = defaultdict(list)
 
-    for from_type, rel_type, to_type, from_id, to_id in result[0][0]:
-        edge_index[
-            (
-                from_type,
-                rel_type.replace("_TRAIN", "").replace("_TEST", "").replace("_VAL", ""),
-                to_type,
+def get_neighborhood_batch(
+    db: Union[Database, InMemoryDatabase],
+    node_ids: list[int],
+    n_neighbor: int,
+    start_neighbor: int,
+    split_type: str,
+    cache: Optional[NeighborhoodCache] = None,
+    num_neighbors: Optional[int] = None,
+) -> dict[int, defaultdict]:
+    """Neighborhoods of all `node_ids` with a single query, keyed by node id (same format as get_neighborhood)"""
+    neighborhoods, missing_ids = dict(), node_ids
+    if cache is not None:
+        neighborhoods, missing_ids = cached_neighborhoods(
+            cache, node_ids, n_neighbor, start_neighbor, split_type
+        )
+    if len(missing_ids) == 0:
+        return neighborhoods
+
+    if isinstance(db, InMemoryDatabase):
+        fetched = db.get_neighborhood_batch(
+            missing_ids, n_neighbor, start_neighbor, split_type, num_neighbors
+        )
+    else:
+        result = db.run_match(
+            *db.query_n_neighbors_batch(
+                node_ids=missing_ids,
+                n_neighbor=n_neighbor,
+                node_type="customer",
+                split_type=split_type,
+                start_neighbor=start_neighbor,
+                num_neighbors=num_neighbors,
             )
-        ].append((int(from_id), int(to_id)))
+        )
+        fetched = to_neighborhoods(missing_ids, result)
+
+    if cache is not None:
+        cache_neighborhoods(cache, fetched, n_neighbor, start_neighbor, split_type)
+    return {**neighborhoods, **fetched}
+
+
+def cached_neighborhoods(
+    cache: NeighborhoodCache,
+    node_ids: list[int],
+    n_neighbor: int,
+    start_neighbor: int,
+    split_type: str,
+) -> tuple[dict[int, defaultdict], list[int]]:
+    """Looks up a batch of neighborhoods, returns the ones found and the ids that have to be queried"""
+    found = cache.get_many(
+        [(node_id, n_neighbor, start_neighbor, split_type) for node_id in node_ids]
+    )
+    neighborhoods = {
+        node_id: neighborhood
+        for node_id, neighborhood in zip(node_ids, found)
+        if neighborhood is not None
+    }
+    return neighborhoods, [
+        node_id for node_id in node_ids if node_id not in neighborhoods
+    ]
+
+
+def cache_neighborhoods(
+    cache: NeighborhoodCache,
+    neighborhoods: dict[int, defaultdict],
+    n_neighbor: int,
+    start_neighbor: int,
+    split_type: str,
+):
+    cache.put_many(
+        [
+            ((node_id, n_neighbor, start_neighbor, split_type), neighborhood)
+            for node_id, neighborhood in neighborhoods.items()
+        ]
+    )
 
-    for key, index in edge_index.items():
-        if len(index) > 0:
-            edge_index[key] = t.tensor(list(map(list, zip(*index))), dtype=t.long)
-        else:
-            edge_index[key] = t.empty(0, dtype=t.long)
 
+def to_neighborhoods(node_ids: list[int], records: list) -> dict[int, defaultdict]:
+    """Per node id edge indexes from the records of query_n_neighbors_batch"""
+    # Customers without relationships (or not in the database) have no record
+    records_per_id = defaultdict(list)
+    for record in records:
+        records_per_id[int(record["id"])].append(record)
+    return {node_id: __to_edge_index(records_per_id[node_id]) for node_id in node_ids}
+
+
+def __to_edge_index(records: list) -> defaultdict:
+    """
+    Edge index per edge type from the edge_type, from_ids, to_ids columns of Database.return_edge_columns,
+    the id lists go through numpy in one go instead of a Python object per edge.
+    """
+    columns = defaultdict(list)
+    for record in records:
+        from_type, rel_type, to_type = record["edge_type"]
+        # The split relationship types (buys_TRAIN, buys_VAL, ...) are all the same edge type
+        key = (
+            from_type,
+            rel_type.replace("_TRAIN", "").replace("_TEST", "").replace("_VAL", ""),
+            to_type,
+        )
+        columns[key].append(
+            np.array([record["from_ids"], record["to_ids"]], dtype=np.int64)
+        )
+
+    edge_index = defaultdict(list)
+    for key, pieces in columns.items():
+        edge_index[key] = t.from_numpy(np.concatenate(pieces, axis=1))
     return edge_index
 
 
-def get_id_map(db: Database) -> tuple[dict, dict]:
-    customers = db.run_match(db.query_all_nodes(node_type="customer"))
-    articles = db.run_match(db.query_all_nodes(node_type="article"))
+def get_id_map(
+    db: Union[Database, InMemoryDatabase], page_size: int = 100_000
+) -> tuple[IdMapArrays, IdMapArrays]:
+    """
+    (node ids, _ids) integer arrays of the customers and the articles, sorted by node id.
+    Streamed page by page, only the two ids of a node are fetched (not the whole node).
+    """
+    if isinstance(db, InMemoryDatabase):
+        return db.get_id_map()
+
+    return tuple(
+        __export_ids(db, node_type, page_size)
+        for node_type in [Constants.node_user, Constants.node_item]
+    )
+
 
-    customer_map = {customer["n"].id: customer["n"]._id for customer in customers}
-    article_map = {article["n"].id: article["n"]._id for article in articles}
+def __export_ids(db: Database, node_type: str, page_size: int) -> IdMapArrays:
+    node_ids, ids = [], []
+    after = -1
+    while True:
+        page = db.run_match(*db.query_id_page(node_type, after, page_size))[0]
+        if len(page["ids"]) == 0:
+            break
+        node_ids.append(np.array(page["ids"], dtype=np.int64))
+        ids.append(np.array(page["_ids"], dtype=np.int64))
+        after = int(node_ids[-1][-1])
 
-    return customer_map, article_map
+    if len(node_ids) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(node_ids), np.concatenate(ids)
@@ -0,0 +1,77 @@
+import torch as t
+from torch import Tensor
+from typing import Dict, List, Tuple
+
+EdgeType = Tuple[str, str, str]
+
+
+class Relabeler:
+    """
+    Maps the global node ids of a sampled subgraph to local ids (starting from zero), for all edge types in one pass.
+    Keeps a preallocated global -> local index per node type that is reused for every subgraph:
+    only the entries of the nodes in the current subgraph are written and then read, so it never needs to be cleared.
+    """
+
+    def __init__(self, num_nodes: Dict[str, int]):
+        self.num_nodes = num_nodes
+        # Allocated on first use, so every dataloader worker builds (and writes) its own
+        self.scratch: Dict[str, Tensor] = dict()
+
+    def __call__(
+        self, *edge_indexes: Dict[EdgeType, Tensor]
+    ) -> Tuple[Dict[str, Tensor], List[Dict[EdgeType, Tensor]]]:
+        """
+        Relabels every [2, num_edges] edge index in the given dicts.
+        Returns the sorted global ids of every node type (local id i belongs to node_ids[node_type][i])
+        and the relabeled dicts, in the order they were passed.
+        """
+        # The endpoints of all edge indexes are collected into one id vector per node type
+        ids = {node_type: [] for node_type in self.num_nodes}
+        for edges in edge_indexes:
+            for edge_type, edge_index in edges.items():
+                edge_index = self.__as_edge_index(edge_index)
+                ids[edge_type[0]].append(edge_index[0])
+                ids[edge_type[2]].append(edge_index[1])
+
+        node_ids, local_ids = dict(), dict()
+        for node_type, pieces in ids.items():
+            if len(pieces) == 0:
+                node_ids[node_type], local_ids[node_type] = t.empty(0, dtype=t.long), []
+                continue
+            global_ids = t.cat(pieces)
+            node_ids[node_type] = t.unique(global_ids)
+            scratch = self.__scratch(node_type)
+            scratch[node_ids[node_type]] = t.arange(node_ids[node_type].shape[0])
+            # Views into the relabeled vector, in the same order as the pieces were collected
+            local_ids[node_type] = list(
+                reversed(t.split(scratch[global_ids], [p.shape[0] for p in pieces]))
+            )
+
+        relabeled = []
+        for edges in edge_indexes:
+            relabeled.append(
+                {
+                    edge_type: t.stack(
+                        [local_ids[edge_type[0]].pop(), local_ids[edge_type[2]].pop()]
+                    )
+                    for edge_type in edges.keys()
+                }
+            )
+        return node_ids, relabeled
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["scratch"] = dict()
+        return state
+
+    def __scratch(self, node_type: str) -> Tensor:
+        if node_type not in self.scratch:
+            self.scratch[node_type] = t.empty(self.num_nodes[node_type], dtype=t.long)
+        return self.scratch[node_type]
+
+    @staticmethod
+    def __as_edge_index(edge_index: Tensor) -> Tensor:
+        # Missing edge types are passed around as t.empty(0)
+        if edge_index.numel() == 0:
+            return t.empty((2, 0), dtype=t.long)
+        return edge_index.to(t.long)
@@ -0,0 +1,135 @@
+import torch as t
+from torch import Tensor
+from typing import Optional
+from .adjacency import CSRAdjacency
+
+max_rejection_rounds = 20
+
+
+class AliasTable:
+    """
+    Walker's alias method: after an O(n) setup, every draw from the discrete distribution is O(1).
+    Used to draw negative articles proportional to their popularity.
+    """
+
+    def __init__(self, weights: Tensor):
+        self.weights = weights.to(t.float64)
+        num_outcomes = weights.shape[0]
+        scaled = (weights.to(t.float64) * num_outcomes / weights.sum()).tolist()
+        prob = [1.0] * num_outcomes
+        alias = list(range(num_outcomes))
+
+        small = [i for i, weight in enumerate(scaled) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left over is 1.0 up to rounding errors, it keeps prob = 1.0
+
+        self.prob = t.tensor(prob, dtype=t.float32)
+        self.alias = t.tensor(alias, dtype=t.long)
+
+    @staticmethod
+    def from_degrees(degrees: Tensor, alpha: float) -> "AliasTable":
+        """Distribution proportional to degree^alpha, nodes without edges are never drawn"""
+        weights = degrees.to(t.float64).pow(alpha)
+        weights[degrees == 0] = 0.0
+        return AliasTable(weights)
+
+    def sample(self, num_samples: int) -> Tensor:
+        outcomes = t.randint(low=0, high=self.prob.shape[0], size=(num_samples,))
+        keep = t.rand(num_samples) < self.prob[outcomes]
+        return t.where(keep, outcomes, self.alias[outcomes])
+
+    def share_memory_(self) -> "AliasTable":
+        self.weights.share_memory_()
+        self.prob.share_memory_()
+        self.alias.share_memory_()
+        return self
+
+
+def sample_negative_items(
+    positive_items: Tensor,
+    num_items: int,
+    num_negatives: int,
+    item_sampler: Optional[AliasTable] = None,
+) -> Tensor:
+    """
+    Draws num_negatives item ids that are not in the sorted positive_items, uniformly or from item_sampler.
+    The cost is proportional to num_negatives (rejected draws are redrawn), not to num_items.
+    """
+    row = CSRAdjacency(
+        t.tensor([0, positive_items.shape[0]]), positive_items.to(t.int32), num_items
+    )
+    return sample_negative_edges(
+        row,
+        t.zeros(1, dtype=t.long),
+        t.tensor([num_negatives]),
+        num_items,
+        item_sampler,
+    )[1]
+
+
+def sample_negative_edges(
+    adjacency: CSRAdjacency,
+    rows: Tensor,
+    num_negatives: Tensor,
+    num_items: int,
+    item_sampler: Optional[AliasTable] = None,
+) -> Tensor:
+    """
+    Batched negative sampling: draws num_negatives[i] item ids for rows[i] that are not edges of the adjacency,
+    returns the [2, num_negatives.sum()] negative edges.
+    """
+    rows = t.repeat_interleave(rows.to(t.long), num_negatives)
+    negatives = t.empty_like(rows)
+    pending = t.arange(rows.shape[0])
+
+    for _ in range(max_rejection_rounds):
+        if pending.numel() == 0:
+            break
+        if item_sampler is not None:
+            candidates = item_sampler.sample(pending.shape[0])
+        else:
+            candidates = t.randint(low=0, high=num_items, size=(pending.shape[0],))
+        accepted = ~adjacency.contains(rows[pending], candidates)
+        negatives[pending[accepted]] = candidates[accepted]
+        pending = pending[~accepted]
+
+    # Rows that own nearly the whole catalog rarely get a draw accepted, they draw from their complement instead,
+    # with the weights of item_sampler (items it never draws stay out of the complement)
+    filled = t.ones(rows.shape[0], dtype=t.bool)
+    for row in rows[pending].unique().tolist():
+        positions = pending[rows[pending] == row]
+        complement = (
+            item_sampler.weights.clone()
+            if item_sampler is not None
+            else t.ones(num_items, dtype=t.float64)
+        )
+        complement[adjacency[row]] = 0.0
+        if complement.sum() == 0:
+            # Rows that own the whole catalog can't be filled, we return fewer negatives for them
+            filled[positions] = False
+            continue
+        negatives[positions] = t.multinomial(
+            complement, positions.numel(), replacement=True
+        )
+    return t.stack([rows[filled], negatives[filled]], dim=0)
+
+
+def sample_per_group(groups: Tensor, n: int) -> Tensor:
+    """Random mask that keeps at most n elements of every group"""
+    if groups.numel() == 0:
+        return t.ones(0, dtype=t.bool)
+    shuffled = t.randperm(groups.numel())
+    order = shuffled[t.sort(groups[shuffled], stable=True)[1]]
+    _, counts = t.unique_consecutive(groups[order], return_counts=True)
+    rank_in_group = t.arange(order.numel()) - t.repeat_interleave(
+        t.cumsum(counts, dim=0) - counts, counts
+    )
+    keep = t.empty(order.numel(), dtype=t.bool)
+    keep[order] = rank_in_group < n
+    return keep
@@ -0,0 +1,179 @@
+import os
+import json
+import numpy as np
+import torch as t
+from tqdm import tqdm
+from torch.utils.data import Dataset
+from torch_geometric.data import HeteroData
+from config import Config
+
+# Config fields that change what the sampler produces, a snapshot is rebuilt if any of them changes
+snapshot_config_fields = [
+    "n_hop_neighbors",
+    "num_neighbors",
+    "candidate_pool_size",
+    "matchers",
+    "positive_edges_ratio",
+    "neo4j",
+]
+
+
+class SnapshotDataset(Dataset):
+    """
+    Serves subgraphs that were sampled once and frozen on disk.
+    Each shard holds the node ids and edge arrays of `shard_size` customers, concatenated and memory-mapped,
+    features are gathered from the graph when a subgraph is served.
+    """
+
+    def __init__(self, directory: str, graph: HeteroData):
+        with open(os.path.join(directory, "meta.json")) as f_in:
+            self.meta = json.load(f_in)
+        self.graph = graph
+        self.shards = [
+            {
+                name: np.load(
+                    os.path.join(directory, str(shard), name + ".npy"), mmap_mode="r"
+                )
+                for name in self.meta["arrays"]
+            }
+            for shard in range(self.meta["num_shards"])
+        ]
+
+    def __len__(self) -> int:
+        return self.meta["length"]
+
+    def __getitem__(self, idx: int) -> HeteroData:
+        shard = self.shards[idx // self.meta["shard_size"]]
+        i = idx % self.meta["shard_size"]
+
+        def read(name: str) -> t.Tensor:
+            ptr = shard[name + "_ptr"]
+            return t.from_numpy(np.array(shard[name][..., ptr[i] : ptr[i + 1]]))
+
+        data = HeteroData()
+        for node_type in self.meta["node_types"]:
+            n_id = read(f"{node_type}.n_id")
+            data[node_type].x = self.graph[node_type].x[n_id]
+            data[node_type].n_id = n_id
+
+        for edge_key, attributes in self.meta["edge_types"].items():
+            edge_type = tuple(edge_key.split("__"))
+            for attribute in attributes:
+                data[edge_type][attribute] = read(f"{edge_key}.{attribute}")
+
+        return data
+
+
+def materialize_snapshot(
+    dataset: Dataset,
+    directory: str,
+    config: Config,
+    shard_size: int = 10_000,
+) -> SnapshotDataset:
+    """Samples every item of the dataset once and freezes it into `directory`, unless an up to date snapshot is already there"""
+    sampling_config = {key: vars(config)[key] for key in snapshot_config_fields}
+    sources = source_fingerprint(dataset)
+    if __is_up_to_date(directory, len(dataset), sampling_config, sources):
+        return SnapshotDataset(directory, dataset.graph)
+
+    print(f"| Materializing snapshot into {directory}...")
+    if os.path.isfile(os.path.join(directory, "meta.json")):
+        os.remove(os.path.join(directory, "meta.json"))
+    meta = dict(
+        length=len(dataset),
+        shard_size=shard_size,
+        num_shards=0,
+        config=sampling_config,
+        sources=sources,
+        node_types=[],
+        edge_types={},
+        arrays=[],
+    )
+
+    for start in tqdm(range(0, len(dataset), shard_size)):
+        arrays = dict()
+        for idx in range(start, min(start + shard_size, len(dataset))):
+            __append_item(arrays, dataset[idx], meta)
+        __save_shard(os.path.join(directory, str(meta["num_shards"])), arrays)
+        meta["arrays"] = sorted(arrays.keys())
+        meta["num_shards"] += 1
+
+    with open(os.path.join(directory, "meta.json"), "w") as fp:
+        json.dump(meta, fp)
+
+    return SnapshotDataset(directory, dataset.graph)
+
+
+def source_fingerprint(dataset: Dataset) -> dict:
+    """
+    Modification time and size of the files the dataset and its matchers were loaded from, and the matchers themselves:
+    re-preprocessed data or a retrained matcher (eg.: new lightgcn candidates) makes a snapshot stale
+    """
+    matchers = getattr(dataset, "matchers", None) or []
+    paths = list(getattr(dataset, "source_files", [])) + [
+        path for matcher in matchers for path in matcher.source_files
+    ]
+    return dict(
+        files={
+            path: [os.stat(path).st_mtime_ns, os.stat(path).st_size]
+            for path in sorted(set(paths))
+        },
+        matchers=[
+            f"{type(matcher).__name__}(k={getattr(matcher, 'k', None)})"
+            for matcher in matchers
+        ],
+    )
+
+
+def __is_up_to_date(
+    directory: str, length: int, sampling_config: dict, sources: dict
+) -> bool:
+    meta_path = os.path.join(directory, "meta.json")
+    if not os.path.isfile(meta_path):
+        return False
+    with open(meta_path) as f_in:
+        meta = json.load(f_in)
+    return (
+        meta["length"] == length
+        and meta["config"] == sampling_config
+        and meta.get("sources") == sources
+    )
+
+
+def __append_item(arrays: dict, data: HeteroData, meta: dict):
+    for node_type in data.node_types:
+        if node_type not in meta["node_types"]:
+            meta["node_types"].append(node_type)
+        __append_array(arrays, f"{node_type}.n_id", data[node_type].n_id)
+
+    for edge_type in data.edge_types:
+        edge_key = "__".join(edge_type)
+        attributes = [
+            attribute
+            for attribute in ["edge_index", "edge_label_index", "edge_label"]
+            if attribute in data[edge_type]
+        ]
+        meta["edge_types"][edge_key] = attributes
+        for attribute in attributes:
+            __append_array(
+                arrays, f"{edge_key}.{attribute}", data[edge_type][attribute]
+            )
+
+
+def __append_array(arrays: dict, name: str, value: t.Tensor):
+    """Arrays are concatenated along their last dimension, `{name}_ptr` keeps where every item starts"""
+    value = value.to(t.long).numpy()
+    pieces = arrays.setdefault(name, [])
+    offsets = arrays.setdefault(name + "_ptr", [0])
+    pieces.append(value)
+    offsets.append(offsets[-1] + value.shape[-1])
+
+
+def __save_shard(directory: str, arrays: dict):
+    os.makedirs(directory, exist_ok=True)
+    for name, pieces in arrays.items():
+        if name.endswith("_ptr"):
+            array = np.asarray(pieces, dtype=np.int64)
+        else:
+            array = np.concatenate(pieces, axis=-1)
+        np.save(os.path.join(directory, name + ".npy"), array)
@@ -1,9 +1,10 @@
 from dataclasses import dataclass
 from enum import Enum
 from typing import Optional, List, Union
+from data.id_map import IdMap
 
-ArticleIdMap = dict
-CustomerIdMap = dict
+ArticleIdMap = IdMap
+CustomerIdMap = IdMap
 
 
 class UserColumn(Enum):
@@ -54,6 +55,7 @@ class PreprocessingConfig(BasePreprocessingConfig):
     text_embedding_colname: Optional[
         str
     ]  # ["derived_name", "derived_look", "derived_category"]
+    compress_neo4j_csv: bool = False  # gzip the csv files of the neo4j import
 
 
 @dataclass
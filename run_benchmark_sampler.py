@@ -0,0 +1,258 @@
+import argparse
+import dataclasses
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import time
+from typing import Optional
+import pandas as pd
+import torch as t
+from torch_geometric import seed_everything
+from config import Config, link_pred_config
+from data.dataset import GraphDataset
+from data.dataset_neo import GraphDataset as GraphDatasetNeo
+from data.neo4j.save import save_to_neo4j
+from tests.data_generator import create_entire_graph_data
+from tests.types import GeneratorConfig
+from tests.util import get_edge_dicts
+from utils.constants import Constants
+
+benchmark_dir = "data/derived/benchmark/"
+output_dir = "output/benchmarks/"
+
+
+def run_benchmark(
+    scales: list[int],
+    num_neighbors: list[int],
+    n_hop_neighbors: list[int],
+    num_samples: int,
+    neo4j: bool,
+    output_path: Optional[str] = None,
+    compare_to: Optional[str] = None,
+) -> dict:
+    """
+    Measures the subgraph samplers (subgraphs/sec, edges/sec and peak memory) on generated graphs.
+    Every case runs in a fresh process, so the peak memory of one case doesn't carry over to the next.
+    """
+    results = []
+    for num_edges in scales:
+        graph_dir = generate_graph(num_edges)
+        if neo4j:
+            load_to_neo4j(graph_dir)
+        for backend in ["memory", "neo4j"] if neo4j else ["memory"]:
+            for num_neighbor in num_neighbors:
+                for n_hop in n_hop_neighbors:
+                    print(
+                        f"| Benchmarking {backend}: {num_edges} edges, num_neighbors={num_neighbor}, n_hop_neighbors={n_hop}..."
+                    )
+                    with multiprocessing.get_context("spawn").Pool(1) as pool:
+                        result = pool.apply(
+                            benchmark_case,
+                            (graph_dir, backend, num_neighbor, n_hop, num_samples),
+                        )
+                    print(
+                        f"| {result['subgraphs_per_sec']:.1f} subgraphs/sec, {result['edges_per_sec']:.0f} edges/sec, {result['peak_rss_mb']:.0f} MB peak"
+                    )
+                    results.append(result)
+
+    report = dict(
+        commit=__git_commit(),
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        platform=platform.platform(),
+        torch=t.__version__,
+        num_samples=num_samples,
+        results=results,
+    )
+
+    if output_path is None:
+        output_path = os.path.join(output_dir, f"sampler_{report['commit'][:8]}.json")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as fp:
+        json.dump(report, fp, indent=2)
+    print(f"| Results saved to {output_path}")
+
+    if compare_to is not None:
+        compare(compare_to, report)
+
+    return report
+
+
+def generate_graph(num_edges: int, directory: str = benchmark_dir) -> str:
+    """Generates (or reuses) a random customer-article graph with roughly `num_edges` edges"""
+    graph_dir = os.path.join(directory, str(num_edges))
+    if os.path.isfile(os.path.join(graph_dir, "rev_edges.pt")):
+        return graph_dir
+
+    print(f"| Generating a graph with {num_edges} edges...")
+    # The graph of a scale is always the same, so results are comparable between commits
+    seed_everything(num_edges)
+    num_users = max(num_edges // 10, 10)
+    num_articles = max(num_edges // 50, 10)
+    graph = create_entire_graph_data(
+        config=GeneratorConfig(
+            num_users=num_users,
+            num_user_features=2,
+            num_articles=num_articles,
+            num_article_features=5,
+            connection_ratio=num_edges / (num_users * num_articles),
+        ),
+        type="generated",
+    )
+    edges_dict, rev_edges_dict = get_edge_dicts(graph[Constants.edge_key].edge_index)
+
+    os.makedirs(graph_dir, exist_ok=True)
+    t.save(graph, os.path.join(graph_dir, "graph.pt"))
+    t.save(edges_dict, os.path.join(graph_dir, "edges.pt"))
+    t.save(rev_edges_dict, os.path.join(graph_dir, "rev_edges.pt"))
+    return graph_dir
+
+
+def load_to_neo4j(graph_dir: str):
+    """Replaces the content of the local neo4j database with the generated graph"""
+    graph = t.load(os.path.join(graph_dir, "graph.pt"))
+    edge_index = graph[Constants.edge_key].edge_index
+    os.makedirs("data/saved", exist_ok=True)
+    save_to_neo4j(
+        pd.DataFrame(graph[Constants.node_user].x.numpy()).reset_index(),
+        pd.DataFrame(graph[Constants.node_item].x.numpy()).reset_index(),
+        pd.DataFrame(
+            {
+                f"{Constants.node_user}_id": edge_index[0].numpy(),
+                f"{Constants.node_item}_id": edge_index[1].numpy(),
+                "train_mask": 1,
+                "val_mask": 0,
+                "test_mask": 0,
+            }
+        ),
+        None,
+        None,
+        None,
+        None,
+    )
+
+
+def benchmark_case(
+    graph_dir: str,
+    backend: str,
+    num_neighbors: int,
+    n_hop_neighbors: int,
+    num_samples: int,
+    num_warmup: int = 10,
+) -> dict:
+    config = dataclasses.replace(
+        link_pred_config,
+        num_neighbors=num_neighbors,
+        n_hop_neighbors=n_hop_neighbors,
+        num_workers=0,
+        neo4j=backend == "neo4j",
+        other_edge_types=[],
+        node_types=[Constants.node_user, Constants.node_item],
+    )
+    dataset = __get_dataset(config, graph_dir)
+
+    # Customers without a purchase can't be sampled
+    customers = t.nonzero(dataset.users.degree() > 0).view(-1)
+    customers = customers[t.randint(0, customers.shape[0], (num_warmup + num_samples,))]
+    for idx in customers[:num_warmup].tolist():
+        dataset[idx]
+
+    num_edges = 0
+    start = time.perf_counter()
+    for idx in customers[num_warmup:].tolist():
+        data = dataset[idx]
+        num_edges += data[Constants.edge_key].edge_index.shape[1]
+    seconds = time.perf_counter() - start
+
+    return dict(
+        backend=backend,
+        num_edges=dataset.users.num_edges,
+        num_users=dataset.users.num_rows,
+        num_articles=dataset.num_articles,
+        num_neighbors=num_neighbors,
+        n_hop_neighbors=n_hop_neighbors,
+        seconds=seconds,
+        subgraphs_per_sec=num_samples / seconds,
+        edges_per_sec=num_edges / seconds,
+        mean_subgraph_edges=num_edges / num_samples,
+        # ru_maxrss is in kilobytes on linux
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    )
+
+
+def compare(previous_path: str, report: dict):
+    """Prints the change in throughput for every case that is in both reports"""
+    with open(previous_path) as f_in:
+        previous = json.load(f_in)
+
+    def key(result: dict) -> tuple:
+        return (
+            result["backend"],
+            result["num_edges"],
+            result["num_neighbors"],
+            result["n_hop_neighbors"],
+        )
+
+    previous_results = {key(result): result for result in previous["results"]}
+    print(f"| Compared to {previous['commit'][:8]}:")
+    for result in report["results"]:
+        if key(result) not in previous_results:
+            continue
+        before = previous_results[key(result)]
+        print(
+            f"| {key(result)}: subgraphs/sec {result['subgraphs_per_sec'] / before['subgraphs_per_sec']:.2f}x, peak memory {result['peak_rss_mb'] / before['peak_rss_mb']:.2f}x"
+        )
+
+
+def __get_dataset(config: Config, graph_dir: str):
+    paths = dict(
+        graph_path=os.path.join(graph_dir, "graph.pt"),
+        users_adj_list=os.path.join(graph_dir, "edges.pt"),
+        articles_adj_list=os.path.join(graph_dir, "rev_edges.pt"),
+    )
+    if config.neo4j:
+        return GraphDatasetNeo(config=config, train=True, split_type="train", **paths)
+    return GraphDataset(config=config, train=True, **paths)
+
+
+def __git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return "unknown"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000, 10_000_000],
+        help="number of edges of the generated graphs",
+    )
+    parser.add_argument("--num-neighbors", type=int, nargs="+", default=[16, 64])
+    parser.add_argument("--n-hop-neighbors", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--num-samples", type=int, default=200)
+    parser.add_argument(
+        "--neo4j",
+        action="store_true",
+        help="also benchmark the neo4j dataset, the local database is overwritten with every generated graph",
+    )
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument(
+        "--compare", type=str, default=None, help="previous results to compare with"
+    )
+    args = parser.parse_args()
+
+    run_benchmark(
+        scales=args.scales,
+        num_neighbors=args.num_neighbors,
+        n_hop_neighbors=args.n_hop_neighbors,
+        num_samples=args.num_samples,
+        neo4j=args.neo4j,
+        output_path=args.output,
+        compare_to=args.compare,
+    )
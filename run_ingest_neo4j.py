@@ -0,0 +1,66 @@
+import argparse
+import pandas as pd
+from data.neo4j.ingest import ingest_to_neo4j
+from data.neo4j.neo4j_database import Database
+
+
+def ingest(
+    transactions_path: str,
+    customers_path: str,
+    articles_path: str,
+    batch_size: int,
+    max_retries: int,
+    db_param: tuple,
+):
+    """Appends new transactions (and their new customers / articles) to the running database, no reimport or restart"""
+    read = lambda path: pd.read_csv(path) if path is not None else None
+    db = Database(*db_param)
+    try:
+        # New nodes with integer _ids next to string ones would split the graph
+        db.check_id_type()
+        ingest_to_neo4j(
+            db,
+            read(customers_path),
+            read(articles_path),
+            read(transactions_path),
+            batch_size=batch_size,
+            max_retries=max_retries,
+        )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "transactions",
+        type=str,
+        help="csv with customer_id, article_id, train_mask, val_mask and test_mask columns (and t_dat or tx)",
+    )
+    parser.add_argument(
+        "--customers",
+        type=str,
+        default=None,
+        help="csv of new customers (index column is the id)",
+    )
+    parser.add_argument(
+        "--articles",
+        type=str,
+        default=None,
+        help="csv of new articles (index column is the id)",
+    )
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--uri", type=str, default="bolt://localhost:7687")
+    parser.add_argument("--user", type=str, default="neo4j")
+    parser.add_argument("--password", type=str, default="password")
+    args = parser.parse_args()
+
+    ingest(
+        args.transactions,
+        args.customers,
+        args.articles,
+        args.batch_size,
+        args.max_retries,
+        (args.uri, args.user, args.password),
+    )
@@ -9,6 +9,7 @@ from model.encoder_decoder import Encoder_Decoder_Model
 
 from utils.get_info import get_feature_info
 from data.data_loader import create_dataloaders
+from data.neo4j.cache import neighborhood_cache_from_config
 from training import test_with_dataloader, train_with_dataloader
 from model.layers import get_linear_layers, get_SAGEConv_layers
 
@@ -82,6 +83,10 @@ def run_pipeline(config: Config) -> Stats:
 
     for epoch in range(0, config.epochs):
         losses = train_with_dataloader(model, optimizer, train_loader, epoch, device)
+        if config.neo4j and config.neighborhood_cache_entries > 0:
+            print(
+                f"| Neighborhood cache: {neighborhood_cache_from_config(config).stats()}"
+            )
 
         report_results(
             output_stats=ContinousStatsTrain(
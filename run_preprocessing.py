@@ -5,7 +5,6 @@ from data.types import (
     BasePreprocessingConfig,
 )
 import torch as t
-import json
 import re
 from run_data_splitting import train_test_split_by_time
 from utils.labelencoder import encode_labels
@@ -19,6 +18,7 @@ from utils.preprocessing import (
     extract_reverse_edges,
 )
 from data.neo4j.save import save_to_neo4j
+from data.feature_store import save_node_features, strip_node_features
 
 
 def save_to_csv(dataframe: pd.DataFrame, name: str):
@@ -89,21 +89,15 @@ def preprocess(config: BasePreprocessingConfig):
         customers = customers[~customers["customer_id"].isin(disjoint_customers)]
         articles = articles[~articles["article_id"].isin(disjoint_articles)]
 
-    customers, customer_id_map_forward, customer_id_map_reverse = create_ids_and_maps(
-        customers, "customer_id", 0
-    )
-    articles, article_id_map_forward, article_id_map_reverse = create_ids_and_maps(
-        articles,
-        "article_id",
-        0,
-    )
+    customers, customer_id_map = create_ids_and_maps(customers, "customer_id")
+    articles, article_id_map = create_ids_and_maps(articles, "article_id")
 
     print("| Parsing transactions...")
-    transactions["article_id"] = transactions["article_id"].apply(
-        lambda x: article_id_map_reverse[x]
+    transactions["article_id"] = article_id_map.to_index(
+        transactions["article_id"].to_numpy()
     )
-    transactions["customer_id"] = transactions["customer_id"].apply(
-        lambda x: customer_id_map_reverse[x]
+    transactions["customer_id"] = customer_id_map.to_index(
+        transactions["customer_id"].to_numpy()
     )
 
     print(
@@ -173,6 +167,12 @@ def preprocess(config: BasePreprocessingConfig):
         None,
     )
 
+    print("| Saving the node features...")
+    # The splits share the same nodes, their features are stored once and memory-mapped when loading
+    train_graph = save_node_features(train_graph)
+    val_graph = strip_node_features(val_graph)
+    test_graph = strip_node_features(test_graph)
+
     print("| Saving the graph...")
     t.save(train_graph, "data/derived/train_graph.pt")
     t.save(val_graph, "data/derived/val_graph.pt")
@@ -189,10 +189,8 @@ def preprocess(config: BasePreprocessingConfig):
     t.save(extract_reverse_edges(transactions_test), "data/derived/rev_edges_test.pt")
 
     print("| Saving the node-to-id mapping...")
-    with open("data/derived/customer_id_map_forward.json", "w") as fp:
-        json.dump(customer_id_map_forward, fp)
-    with open("data/derived/article_id_map_forward.json", "w") as fp:
-        json.dump(article_id_map_forward, fp)
+    customer_id_map.save("data/derived/customer_id_map.npy")
+    article_id_map.save("data/derived/article_id_map.npy")
 
 
 def extract_users_per_location(customers: pd.DataFrame) -> dict:
@@ -5,7 +5,6 @@ from data.types import (
     PreprocessingConfig,
 )
 import torch as t
-import json
 from utils.labelencoder import encode_labels
 from config import preprocessing_config
 from utils.preprocessing import (
@@ -17,6 +16,7 @@ from utils.preprocessing import (
 )
 from utils.constants import Constants
 from data.neo4j.save import save_to_neo4j
+from data.feature_store import save_node_features, strip_node_features
 
 
 def preprocess(config: PreprocessingConfig):
@@ -74,14 +74,8 @@ def preprocess(config: PreprocessingConfig):
         customers = customers[~customers["customer_id"].isin(disjoint_customers)]
         articles = articles[~articles["article_id"].isin(disjoint_articles)]
 
-    customers, customer_id_map_forward, customer_id_map_reverse = create_ids_and_maps(
-        customers, "customer_id", 0
-    )
-    articles, article_id_map_forward, article_id_map_reverse = create_ids_and_maps(
-        articles,
-        "article_id",
-        0,
-    )
+    customers, customer_id_map = create_ids_and_maps(customers, "customer_id")
+    articles, article_id_map = create_ids_and_maps(articles, "article_id")
 
     extra_nodes = None
     extra_edges = None
@@ -91,32 +85,26 @@ def preprocess(config: PreprocessingConfig):
             articles[Constants.node_extra].unique(),
             columns=[Constants.node_extra],
         )
-        (
-            extra_nodes,
-            extra_nodes_id_map_forward,
-            extra_nodes_id_map_reverse,
-        ) = create_ids_and_maps(
-            extra_nodes,
-            Constants.node_extra,
-            0,
+        extra_nodes, extra_nodes_id_map = create_ids_and_maps(
+            extra_nodes, Constants.node_extra
         )
         extra_edges = articles[["article_id", Constants.node_extra]]
-        extra_edges[Constants.node_extra] = extra_edges[Constants.node_extra].apply(
-            lambda x: extra_nodes_id_map_reverse[x]
+        extra_edges[Constants.node_extra] = extra_nodes_id_map.to_index(
+            extra_edges[Constants.node_extra].to_numpy()
         )
-        extra_edges["article_id"] = extra_edges["article_id"].apply(
-            lambda x: article_id_map_reverse[x]
+        extra_edges["article_id"] = article_id_map.to_index(
+            extra_edges["article_id"].to_numpy()
         )
         extra_edges.rename(
             columns={Constants.node_extra: f"{Constants.node_extra}_id"}, inplace=True
         )
 
     print("| Parsing transactions...")
-    transactions["article_id"] = transactions["article_id"].apply(
-        lambda x: article_id_map_reverse[x]
+    transactions["article_id"] = article_id_map.to_index(
+        transactions["article_id"].to_numpy()
     )
-    transactions["customer_id"] = transactions["customer_id"].apply(
-        lambda x: customer_id_map_reverse[x]
+    transactions["customer_id"] = customer_id_map.to_index(
+        transactions["customer_id"].to_numpy()
     )
     transactions_train = transactions[transactions["train_mask"] == True]
     transactions_val = pd.concat(
@@ -191,6 +179,7 @@ def preprocess(config: PreprocessingConfig):
             Constants.node_extra if Constants.node_extra is not None else None,
             extra_edges if extra_edges is not None else None,
             Constants.rel_type_extra,
+            config.compress_neo4j_csv,
         )
 
     print("| Converting to tensors...")
@@ -252,6 +241,12 @@ def preprocess(config: PreprocessingConfig):
         Constants.edge_key_extra,
     )
 
+    print("| Saving the node features...")
+    # The splits share the same nodes, their features are stored once and memory-mapped when loading
+    train_graph = save_node_features(train_graph)
+    val_graph = strip_node_features(val_graph)
+    test_graph = strip_node_features(test_graph)
+
     print("| Saving the graph...")
     t.save(train_graph, "data/derived/train_graph.pt")
     t.save(val_graph, "data/derived/val_graph.pt")
@@ -268,10 +263,8 @@ def preprocess(config: PreprocessingConfig):
     t.save(extract_reverse_edges(transactions_test), "data/derived/rev_edges_test.pt")
 
     print("| Saving the node-to-id mapping...")
-    with open("data/derived/customer_id_map_forward.json", "w") as fp:
-        json.dump(customer_id_map_forward, fp)
-    with open("data/derived/article_id_map_forward.json", "w") as fp:
-        json.dump(article_id_map_forward, fp)
+    customer_id_map.save("data/derived/customer_id_map.npy")
+    article_id_map.save("data/derived/article_id_map.npy")
 
 
 def extract_users_per_location(customers: pd.DataFrame) -> dict:
@@ -6,6 +6,8 @@ from torch import Tensor
 from config import link_pred_config, Config
 from data.data_loader import create_dataloaders
 from utils.get_info import select_properties
+from data.id_map import IdMap
+from functools import reduce
 
 from os import listdir
 from os.path import isfile, join
@@ -22,24 +24,23 @@ def load_model(url: str):
 
 
 def load_dataloaders(config: Config):
-    _, _, test_loader, customer_id_map, article_id_map, _ = create_dataloaders(config)
+    # Only the test split and the id maps are loaded
+    loaders = create_dataloaders(config)
 
-    return test_loader, customer_id_map, article_id_map
+    return loaders.test_loader, loaders.customer_id_map, loaders.article_id_map
 
 
 def map_to_id(
-    predictions: Tensor, customer_id_map: dict, article_id_map: dict
+    predictions: Tensor, customer_id_map: IdMap, article_id_map: IdMap
 ) -> pd.DataFrame:
-    df = pd.DataFrame(predictions.numpy())
-
-    for col in df.columns:
-        df[col] = df[col].map(str).map(article_id_map)
-
-    df["customer_id"] = df.index.to_series().map(lambda x: customer_id_map[str(x)])
-    df["prediction"] = (
-        df[[column for column in df.columns if column != "customer_id"]]
-        .astype(str)
-        .agg(" ".join, axis=1)
+    # One lookup for the whole prediction matrix instead of a dict lookup per cell
+    articles = article_id_map.to_original(predictions.numpy()).astype(str)
+    df = pd.DataFrame(articles)
+
+    df["customer_id"] = customer_id_map.to_original(np.arange(len(df)))
+    df["prediction"] = reduce(
+        lambda joined, column: np.char.add(np.char.add(joined, " "), column),
+        articles.T,
     )
 
     return df
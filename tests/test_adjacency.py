@@ -0,0 +1,29 @@
+import torch as t
+from data.adjacency import CSRAdjacency
+from tests.util import get_edge_dicts
+
+
+edge_index = t.tensor([[0, 0, 0, 1, 1, 2, 2], [4, 2, 0, 1, 5, 3, 0]], dtype=t.long)
+
+
+def test_csr_matches_adjacency_dicts():
+    edges_dict, rev_edges_dict = get_edge_dicts(edge_index)
+    users = CSRAdjacency.from_dict(edges_dict)
+    articles = CSRAdjacency.from_dict(rev_edges_dict, num_rows=6)
+
+    assert len(users) == len(edges_dict)
+    assert len(articles) == 6
+    for user, purchased in edges_dict.items():
+        assert users[user].tolist() == sorted(purchased)
+    for article, customers in rev_edges_dict.items():
+        assert articles[article].tolist() == sorted(customers)
+
+
+def test_csr_neighbours_and_edges():
+    users = CSRAdjacency.from_edge_index(edge_index)
+    rows = t.tensor([2, 0])
+
+    assert users.neighbours(rows).tolist() == [0, 3, 0, 2, 4]
+    assert users.edges(rows).tolist() == [[2, 2, 0, 0, 0], [0, 3, 0, 2, 4]]
+    assert users.degree(rows).tolist() == [2, 3]
+    assert users.neighbours(t.tensor([], dtype=t.long)).numel() == 0
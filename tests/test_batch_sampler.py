@@ -0,0 +1,93 @@
+import pytest
+import torch as t
+from torch_geometric.data import HeteroData
+from data.adjacency import CSRAdjacency
+from data.batch_sampler import (
+    DegreeBucketBatchSampler,
+    EdgeBudgetBatchSampler,
+    estimate_subgraph_sizes,
+)
+from data.dataset import fetch_n_hop_neighbourhood
+from data.neo4j.in_memory_database import InMemoryDatabase
+from utils.constants import Constants
+
+
+def test_degree_buckets():
+    sizes = t.cat([t.full((20,), 1.0), t.full((20,), 100.0)])
+    sampler = DegreeBucketBatchSampler(sizes, batch_size=8, num_buckets=2)
+    batches = list(sampler)
+
+    assert len(batches) == len(sampler) == 6
+    assert sorted(sum(batches, [])) == list(range(40))
+    # Light and heavy customers never share a batch
+    assert all(len(set(sizes[batch].tolist())) == 1 for batch in batches)
+
+
+def test_estimated_subgraph_sizes():
+    users = CSRAdjacency.from_dict({0: [0], 1: [0, 1, 2]})
+    articles = CSRAdjacency.from_dict({0: [0, 1], 1: [1], 2: [1]})
+    # Own purchases + the relationships of the other customers of their articles
+    edges, nodes = estimate_subgraph_sizes(users, articles, -1, 2, per_node=True)
+    assert edges.tolist() == pytest.approx([1 + 1, 3 + 1])
+
+
+@pytest.mark.parametrize("per_node", [False, True])
+def test_estimates_match_sampled_subgraphs(per_node: bool):
+    t.manual_seed(0)
+    # Skewed degrees, like the purchases of the real datasets
+    purchases = t.stack(
+        [(t.rand(5000) ** 2 * 500).long(), (t.rand(5000) ** 3 * 200).long()]
+    ).unique(dim=1)
+    users = CSRAdjacency.from_edge_index(purchases, 500, 200)
+    articles = CSRAdjacency.from_edge_index(purchases.flip(0), 200, 500)
+    graph = HeteroData()
+    graph[Constants.node_user].num_nodes = 500
+    graph[Constants.node_item].num_nodes = 200
+    graph[Constants.edge_key].edge_index = purchases
+    db = InMemoryDatabase({"train": graph})
+
+    sampled_edges, sampled_nodes = [], []
+    for user_id in range(0, 500, 10):
+        if per_node:
+            neighbourhood = t.cat(
+                list(
+                    db.get_neighborhood(
+                        user_id, 3, 1, "train", num_neighbors=8
+                    ).values()
+                ),
+                dim=1,
+            )
+        else:
+            neighbourhood = fetch_n_hop_neighbourhood(3, user_id, users, articles, 8)
+        edges = t.cat([users.edges(t.tensor([user_id])), neighbourhood], dim=1)
+        sampled_edges.append(edges.shape[1])
+        sampled_nodes.append(edges[0].unique().numel() + edges[1].unique().numel())
+
+    edges, nodes = estimate_subgraph_sizes(users, articles, 8, 3, per_node)
+    assert edges[::10].mean() == pytest.approx(
+        t.tensor(sampled_edges).float().mean(), rel=0.3
+    )
+    assert nodes[::10].mean() == pytest.approx(
+        t.tensor(sampled_nodes).float().mean(), rel=0.3
+    )
+
+
+def test_edge_budget():
+    edges = t.tensor([5.0, 5.0, 5.0, 30.0, 1.0])
+    sampler = EdgeBudgetBatchSampler(edges, edges, max_edges=10, shuffle=False)
+    # The customer over the budget is a batch on its own
+    assert list(sampler) == [[0, 1], [2], [3], [4]]
+
+    sampler = EdgeBudgetBatchSampler(edges, edges, max_edges=100, max_nodes=12)
+    assert all(edges[batch].sum() <= 12 or len(batch) == 1 for batch in sampler)
+
+
+def test_edge_budget_length_matches_shuffled_epochs():
+    t.manual_seed(0)
+    edges = t.randint(1, 10, (50,)).to(t.float)
+    sampler = EdgeBudgetBatchSampler(edges, edges, max_edges=12)
+    for _ in range(5):
+        num_batches = len(sampler)
+        batches = list(sampler)
+        assert len(batches) == num_batches
+        assert sorted(idx for batch in batches for idx in batch) == list(range(50))
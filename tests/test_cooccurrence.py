@@ -0,0 +1,24 @@
+from data.adjacency import CSRAdjacency
+from data.matching.cooccurrence import CoOccurrence
+
+
+def test_top_k_is_ranked_by_co_occurrence():
+    users = CSRAdjacency.from_dict(
+        {0: [0, 1], 1: [0, 1, 2], 2: [0, 2, 3], 3: [1, 3], 4: [4]}
+    )
+    # A block per item, so the blocks have to be put back together
+    co_occurrence = CoOccurrence(users, num_items=5, block_size=1)
+    assert co_occurrence.matrix[0, 0] == 0
+    assert co_occurrence.matrix[0, 1] == 2
+
+    top = co_occurrence.top_k([0, 4, 10], k=2)
+    # Item 2: 2 (via 0) + 1 (via 1), item 3: 1 (via 0) + 1 (via 1), own items are left out
+    assert top[0].tolist() == [2, 3]
+    # Nobody else bought item 4, unknown customers get nothing
+    assert top[1].tolist() == [] and top[2].tolist() == []
+
+
+def test_item_neighbors_are_pruned():
+    users = CSRAdjacency.from_dict({0: [0, 1, 2], 1: [0, 1], 2: [0, 1]})
+    co_occurrence = CoOccurrence(users, num_items=3, max_item_neighbors=1)
+    assert co_occurrence.matrix[0].nonzero()[1].tolist() == [1]
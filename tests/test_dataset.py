@@ -4,13 +4,18 @@ import torch as t
 from tests.data_generator import create_entire_graph_data, create_subgraph_comparison
 from torch_geometric import seed_everything
 from tests.util import (
+    get_dataset,
     get_first_item_from_dataset,
     deconstruct_heterodata,
     preprocess_and_load_to_neo4j,
 )
 from tests.types import GeneratorConfig, generator_config
 from config import link_pred_config
+from data.snapshot import materialize_snapshot, source_fingerprint
+from data.matching import PopularItemsMatcher
+from data.matching.type import Matcher
 import pandas as pd
+import os
 
 seed_everything(5)
 # Generate and save entire graph data:
@@ -33,6 +38,87 @@ def test_integrity_base(graph_database: bool = False):
     integrity_nodes(data=data_from_dataset, data_comp=data_comparison)
 
 
+def test_integrity_batched():
+    data_from_dataset = get_first_item_from_dataset(graph_database=False, batched=True)
+
+    integrity_edges(data=data_from_dataset, data_comp=data_comparison)
+    integrity_nodes(data=data_from_dataset, data_comp=data_comparison)
+
+
+def test_integrity_snapshot(tmp_path):
+    dataset = get_dataset(graph_database=False)
+    snapshot = materialize_snapshot(dataset, str(tmp_path), dataset.config)
+    assert len(snapshot) == len(dataset)
+
+    integrity_edges(data=snapshot[0], data_comp=data_comparison)
+    integrity_nodes(data=snapshot[0], data_comp=data_comparison)
+
+
+def test_snapshot_is_rebuilt_when_its_sources_change(tmp_path):
+    dataset = get_dataset(graph_database=False)
+    snapshot = materialize_snapshot(dataset, str(tmp_path), dataset.config)
+    sources = snapshot.meta["sources"]
+    assert (
+        materialize_snapshot(dataset, str(tmp_path), dataset.config).meta["sources"]
+        == sources
+    )
+
+    # Re-preprocessed data, with the same number of customers
+    stat = os.stat(dataset.source_files[1])
+    os.utime(dataset.source_files[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    snapshot = materialize_snapshot(dataset, str(tmp_path), dataset.config)
+    assert snapshot.meta["sources"] == source_fingerprint(dataset) != sources
+
+    # A different matcher
+    matcher = PopularItemsMatcher.__new__(PopularItemsMatcher)
+    matcher.k = 5
+    dataset.matchers = [matcher]
+    snapshot = materialize_snapshot(dataset, str(tmp_path), dataset.config)
+    assert snapshot.meta["sources"]["matchers"] == ["PopularItemsMatcher(k=5)"]
+
+
+def test_in_memory_database():
+    # The neo4j dataset without a neo4j server
+    dataset = get_dataset(graph_database=True, neo4j_backend="memory")
+
+    for data in [dataset[0], dataset.sample_batch(t.tensor([0, 1]))]:
+        edges = data[Constants.edge_key]
+        assert edges.edge_label.sum() > 0
+        # Every edge of the subgraph is a purchase in the graph
+        users = data[Constants.node_user].n_id[edges.edge_index[0]]
+        articles = data[Constants.node_item].n_id[edges.edge_index[1]]
+        assert dataset.users.contains(users, articles).all()
+
+
+class FixedMatcher(Matcher):
+    def __init__(self, articles: list):
+        self.articles = t.tensor(articles)
+
+    def get_matches(self, user_id: int) -> t.Tensor:
+        return self.articles
+
+
+def test_candidates_are_matches_without_positives():
+    dataset = get_dataset(graph_database=False)
+    neo_dataset = get_dataset(graph_database=True, neo4j_backend="memory")
+    for d in [dataset, neo_dataset]:
+        d.train = False
+        # Overlapping matchers, with positives of the customers among the matches
+        d.matchers = [FixedMatcher([0, 1, 2]), FixedMatcher([2, 3])]
+
+    user_ids = t.arange(len(dataset))
+    batch_candidates = dataset.get_candidates_batch(user_ids)
+    for user_id in user_ids.tolist():
+        positives = dataset.users[user_id]
+        expected = [a for a in range(4) if a not in positives.tolist()]
+        assert dataset.get_candidates(user_id).tolist() == expected
+        assert batch_candidates[1][batch_candidates[0] == user_id].tolist() == expected
+        neo_candidates = neo_dataset.get_negative_sampled_edges(
+            positives, user_id, 1.0, 1
+        )
+        assert neo_candidates[1].tolist() == expected
+
+
 def integrity_edges(data: HeteroData, data_comp: HeteroData = data_comparison):
     for edge_type in [Constants.edge_key, Constants.rev_edge_key]:
         edges = data[edge_type]
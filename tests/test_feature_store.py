@@ -0,0 +1,35 @@
+import os
+import pytest
+import torch as t
+from torch_geometric.data import HeteroData
+from data.feature_store import load_graph, save_node_features
+
+
+def __graph(num_users: int) -> HeteroData:
+    graph = HeteroData()
+    graph["customer"].x = t.rand(num_users, 2)
+    graph["article"].x = t.rand(4, 3)
+    graph["customer", "buys", "article"].edge_index = t.tensor([[0, 1], [2, 3]])
+    return graph
+
+
+def test_splits_share_the_memory_mapped_features(tmp_path):
+    graph = __graph(num_users=3)
+    features = {node_type: graph[node_type].x.clone() for node_type in graph.node_types}
+    stripped = save_node_features(graph, os.path.join(tmp_path, "features"))
+    for split_type in ["train", "val"]:
+        t.save(stripped, os.path.join(tmp_path, f"{split_type}_graph.pt"))
+
+    train = load_graph(os.path.join(tmp_path, "train_graph.pt"))
+    val = load_graph(os.path.join(tmp_path, "val_graph.pt"))
+    for node_type, x in features.items():
+        assert t.equal(train[node_type].x, x)
+        assert train[node_type].x.data_ptr() == val[node_type].x.data_ptr()
+
+
+def test_features_must_match_the_graph(tmp_path):
+    save_node_features(__graph(num_users=3), os.path.join(tmp_path, "features"))
+    other = save_node_features(__graph(num_users=5), os.path.join(tmp_path, "other"))
+    t.save(other, os.path.join(tmp_path, "train_graph.pt"))
+    with pytest.raises(AssertionError):
+        load_graph(os.path.join(tmp_path, "train_graph.pt"))
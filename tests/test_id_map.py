@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from data.id_map import IdMap
+from data.neo4j.neo4j_database import Database
+from data.neo4j.utils import get_id_map
+
+
+class PagedDatabase(Database):
+    """Answers query_id_page from a list of nodes, without a server"""
+
+    def __init__(self, nodes: dict):
+        self.nodes = nodes
+        self.num_pages = 0
+
+    def run_match(self, query: str, parameters: dict) -> list:
+        self.num_pages += 1
+        node_type = query.split("(n:")[1].split(")")[0]
+        page = sorted(
+            (node_id, _id)
+            for node_id, _id in self.nodes[node_type]
+            if node_id > parameters["after"]
+        )[: parameters["page_size"]]
+        return [dict(ids=[p[0] for p in page], _ids=[p[1] for p in page])]
+
+
+def test_id_map_is_exported_in_pages():
+    db = PagedDatabase(
+        dict(
+            customer=[(7, 2), (3, 0), (5, 1), (9, 3), (11, 4)],
+            article=[],
+        )
+    )
+    (customer_ids, customer_map), (article_ids, article_map) = get_id_map(
+        db, page_size=2
+    )
+    assert customer_ids.tolist() == [3, 5, 7, 9, 11]
+    assert customer_map.tolist() == [0, 1, 2, 3, 4]
+    assert customer_ids.dtype == np.int64
+    assert len(article_ids) == 0 and len(article_map) == 0
+    # 3 pages of customers and an empty one, an empty page of articles
+    assert db.num_pages == 5
+
+
+def test_string_ids_of_old_imports_are_refused():
+    class OldDatabase(Database):
+        def __init__(self, _id):
+            self._id = _id
+
+        def run_match(self, query: str, parameters: dict) -> list:
+            return [dict(_id=self._id)]
+
+    OldDatabase(3).check_id_type()
+    with pytest.raises(TypeError):
+        OldDatabase("3").check_id_type()
+
+
+def test_id_map_lookups(tmp_path):
+    IdMap.from_values(np.array(["c", "a", "b"], dtype=object)).save(
+        str(tmp_path / "id_map.npy")
+    )
+    id_map = IdMap.load(str(tmp_path / "id_map.npy"))
+    assert isinstance(id_map.ids, np.memmap)
+
+    assert id_map.to_original([2, 0]).tolist() == ["b", "c"]
+    assert id_map.to_index(["a", "c", "b"]).tolist() == [1, 0, 2]
+    with pytest.raises(KeyError):
+        id_map.to_index(["d"])
@@ -0,0 +1,126 @@
+import pandas as pd
+import pytest
+import torch as t
+from torch_geometric.data import HeteroData
+from data.neo4j.in_memory_database import InMemoryDatabase
+from data.neo4j.ingest import ingest_to_neo4j
+from data.neo4j.utils import to_neighborhoods
+from utils.constants import Constants
+
+
+def create_graph(buys: list) -> HeteroData:
+    graph = HeteroData()
+    graph[Constants.node_user].num_nodes = 3
+    graph[Constants.node_item].num_nodes = 4
+    graph[Constants.node_extra].num_nodes = 2
+    graph[Constants.edge_key].edge_index = t.tensor(buys).t()
+    # Same layout as create_data_pyg: [article, colour] edges under (colour, has_color, article)
+    graph[
+        (Constants.node_extra, Constants.rel_type_extra, Constants.node_item)
+    ].edge_index = t.tensor([[0, 1, 2, 3], [0, 0, 1, 1]])
+    return graph
+
+
+train_buys = [[0, 0], [1, 0], [1, 1], [2, 2]]
+db = InMemoryDatabase(
+    {
+        "train": create_graph(train_buys),
+        "val": create_graph(train_buys + [[2, 1]]),
+    }
+)
+
+
+def as_lists(neighborhood: dict) -> dict:
+    return {key: value.tolist() for key, value in neighborhood.items()}
+
+
+def test_levels_and_relationship_types():
+    # Customer 0 and its own purchase are not part of the neighborhood (minLevel 1)
+    assert as_lists(db.get_neighborhood(0, 2, 1, "train")) == {
+        Constants.edge_key: [[1], [0]],
+        Constants.edge_key_extra: [[0], [0]],
+    }
+    assert as_lists(db.get_neighborhood(0, 3, 1, "train")) == {
+        Constants.edge_key: [[1, 1], [0, 1]],
+        Constants.edge_key_extra: [[0, 1], [0, 0]],
+    }
+
+
+def test_split_filtering():
+    assert as_lists(db.get_neighborhood(0, 4, 1, "train")) == as_lists(
+        db.get_neighborhood(0, 3, 1, "train")
+    )
+    # Customer 2 is only reachable through its validation purchase
+    assert as_lists(db.get_neighborhood(0, 4, 1, "val"))[Constants.edge_key] == [
+        [1, 1, 2],
+        [0, 1, 1],
+    ]
+
+
+def test_records_match_neo4j_format():
+    records = db.run_match(
+        *db.query_n_neighbors_batch(
+            node_ids=[0, 2], n_neighbor=3, node_type="customer", split_type="val"
+        )
+    )
+    neighborhoods = to_neighborhoods([0, 2], records)
+    for node_id in [0, 2]:
+        assert as_lists(neighborhoods[node_id]) == as_lists(
+            db.get_neighborhood(node_id, 3, 0, "val")
+        )
+
+
+def test_fan_out_limit():
+    full = as_lists(db.get_neighborhood(0, 3, 1, "train"))
+    # A fan-out larger than any degree keeps every hop of the (tree shaped) neighborhood
+    assert as_lists(db.get_neighborhood(0, 3, 1, "train", num_neighbors=100)) == full
+
+    for _ in range(10):
+        sampled = as_lists(db.get_neighborhood(0, 3, 1, "train", num_neighbors=1))
+        edges = [
+            (edge_type, edge)
+            for edge_type, edge_index in sampled.items()
+            for edge in zip(*edge_index)
+        ]
+        # One relationship out of article 0 (hop 2), then one out of the node it reached (hop 3)
+        assert len(edges) == 2
+        assert all(
+            list(edge) in [list(e) for e in zip(*full[edge_type])]
+            for edge_type, edge in edges
+        )
+
+
+def test_edge_columns_are_merged_per_edge_type():
+    # Rows of the different split relationship types of one customer end up in one edge index
+    records = [
+        dict(id=0, edge_type=list(Constants.edge_key), from_ids=[1], to_ids=[0]),
+        dict(
+            id=0,
+            edge_type=[
+                Constants.node_user,
+                f"{Constants.rel_type}_VAL",
+                Constants.node_item,
+            ],
+            from_ids=[2],
+            to_ids=[1],
+        ),
+    ]
+    neighborhoods = to_neighborhoods([0, 1], records)
+    assert as_lists(neighborhoods[0]) == {Constants.edge_key: [[1, 2], [0, 1]]}
+    assert as_lists(neighborhoods[1]) == {}
+
+
+def test_writes_are_refused():
+    transactions = pd.DataFrame(
+        {
+            f"{Constants.node_user}_id": [0],
+            f"{Constants.node_item}_id": [3],
+            "train_mask": [1],
+            "val_mask": [0],
+            "test_mask": [0],
+        }
+    )
+    with pytest.raises(PermissionError):
+        ingest_to_neo4j(db, None, None, transactions)
+    with pytest.raises(PermissionError):
+        db.run_write("CREATE (n)", dict())
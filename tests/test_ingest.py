@@ -0,0 +1,163 @@
+import pandas as pd
+import pytest
+from neo4j.exceptions import ServiceUnavailable, TransientError
+from data.neo4j.ingest import ingest_to_neo4j, write_in_batches
+from utils.constants import Constants
+
+
+class RecordingDatabase:
+    """Records the write queries instead of sending them, fails the first `failures` writes"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.writes = []
+
+    def run_query(self, query: str, parameters: dict):
+        pass
+
+    def run_write(self, query: str, parameters: dict):
+        if self.failures > 0:
+            self.failures -= 1
+            raise TransientError("deadlock")
+        self.writes.append((query, parameters))
+
+
+class GraphDatabase(RecordingDatabase):
+    """
+    Applies query_merge_purchases to a dict of relationships keyed by tx: the relationship of the tx is merged,
+    a relationship of the tx of another split type is replaced. Loses the acknowledgement of the first `lost_acks` writes.
+    """
+
+    def __init__(self, lost_acks: int = 0):
+        super().__init__()
+        self.lost_acks = lost_acks
+        self.relationships = dict()
+
+    def run_write(self, query: str, parameters: dict):
+        relationship_type = query.split("MERGE (c)-[r:")[1].split(" ")[0]
+        for row in parameters["rows"]:
+            old = self.relationships.get(row["tx"])
+            if (
+                old is not None
+                and old[0] not in [relationship_type] + parameters["other_types"]
+            ):
+                old = None
+            properties = {
+                **(old[3] if old is not None else dict()),
+                **row["properties"],
+            }
+            self.relationships[row["tx"]] = (
+                relationship_type,
+                row["customer_id"],
+                row["article_id"],
+                properties,
+            )
+        if self.lost_acks > 0:
+            self.lost_acks -= 1
+            raise ServiceUnavailable("connection lost")
+
+
+def transactions_of(rows: list) -> pd.DataFrame:
+    return pd.DataFrame(
+        rows,
+        columns=[
+            f"{Constants.node_user}_id",
+            f"{Constants.node_item}_id",
+            "t_dat",
+            "train_mask",
+            "val_mask",
+            "test_mask",
+        ],
+    )
+
+
+def test_purchases_are_merged_per_split_type_in_batches():
+    db = RecordingDatabase()
+    transactions = transactions_of(
+        [
+            [0, 5, "2020-09-01", 1, 0, 0],
+            [0, 5, "2020-09-01", 1, 0, 0],
+            [2, 7, "2020-09-01", 1, 0, 0],
+            [3, 8, "2020-09-02", 0, 1, 0],
+            [4, 9, "2020-09-03", 0, 0, 1],
+        ]
+    )
+    ingest_to_neo4j(db, None, None, transactions, batch_size=2)
+
+    batches = [
+        (query.split("MERGE (c)-[r:")[1].split(" ")[0], parameters)
+        for query, parameters in db.writes
+    ]
+    assert [(split_type, len(p["rows"])) for split_type, p in batches] == [
+        (f"{Constants.rel_type}_TRAIN", 2),
+        (f"{Constants.rel_type}_TRAIN", 1),
+        (f"{Constants.rel_type}_VAL", 1),
+        (f"{Constants.rel_type}_TEST", 1),
+    ]
+    # A repeat purchase is a transaction of its own
+    assert [row["tx"] for row in batches[0][1]["rows"]] == [
+        "0-5-2020-09-01-0",
+        "0-5-2020-09-01-1",
+    ]
+    assert batches[2][1]["rows"][0] == dict(
+        tx="3-8-2020-09-02-0",
+        customer_id=3,
+        article_id=8,
+        properties=dict(train_mask=0, val_mask=1, test_mask=0),
+    )
+    assert batches[2][1]["other_types"] == [
+        f"{Constants.rel_type}_TRAIN",
+        f"{Constants.rel_type}_TEST",
+    ]
+
+
+def test_purchases_are_retyped_in_place():
+    db = GraphDatabase()
+    repeat = [[0, 5, "2020-09-01", 1, 0, 0], [0, 5, "2020-09-01", 1, 0, 0]]
+    ingest_to_neo4j(
+        db, None, None, transactions_of(repeat + [[3, 8, "2020-09-02", 0, 1, 0]])
+    )
+    before = dict(db.relationships)
+
+    # The VAL purchase moves to TRAIN, the repeat purchase is not part of the feed
+    ingest_to_neo4j(db, None, None, transactions_of([[3, 8, "2020-09-02", 1, 0, 0]]))
+    assert len(db.relationships) == 3
+    assert db.relationships["3-8-2020-09-02-0"] == (
+        f"{Constants.rel_type}_TRAIN",
+        3,
+        8,
+        dict(train_mask=1, val_mask=0, test_mask=0),
+    )
+    for tx in ["0-5-2020-09-01-0", "0-5-2020-09-01-1"]:
+        assert db.relationships[tx] == before[tx]
+
+
+def test_ingestion_is_idempotent():
+    transactions = transactions_of(
+        [[0, 5, "2020-09-01", 1, 0, 0], [0, 5, "2020-09-01", 1, 0, 0]]
+    )
+    db = GraphDatabase()
+    ingest_to_neo4j(db, None, None, transactions)
+    relationships = dict(db.relationships)
+
+    # The commit of the first batch went through but its acknowledgement was lost, the retry merges the same rows
+    db = GraphDatabase(lost_acks=1)
+    ingest_to_neo4j(db, None, None, transactions, max_retries=1, batch_size=1)
+    ingest_to_neo4j(db, None, None, transactions)
+    assert db.relationships == relationships
+
+
+def test_failed_batches_are_retried():
+    db = RecordingDatabase(failures=2)
+    write_in_batches(db, ("query", dict()), [1, 2, 3], 2, max_retries=2, retry_delay=0)
+    assert [parameters["rows"] for _, parameters in db.writes] == [[1, 2], [3]]
+
+    with pytest.raises(TransientError):
+        write_in_batches(
+            RecordingDatabase(failures=2),
+            ("query", dict()),
+            [1],
+            2,
+            max_retries=1,
+            retry_delay=0,
+        )
@@ -0,0 +1,23 @@
+import torch as t
+from data.adjacency import CSRAdjacency
+from data.matching import PopularItemsMatcher, UsersWithCommonItemsMatcher
+from data.matching.cooccurrence import CoOccurrence
+from data.matching.type import Matcher
+
+
+def test_batched_matches_are_the_matches_of_every_customer():
+    popular = PopularItemsMatcher.__new__(PopularItemsMatcher)
+    popular.popular_items, popular.k = t.tensor([4, 2, 0]), 2
+
+    common = UsersWithCommonItemsMatcher.__new__(UsersWithCommonItemsMatcher)
+    users = CSRAdjacency.from_dict({0: [0, 1], 1: [0, 1, 2], 2: [0, 2, 3], 3: [4]})
+    common.co_occurrence, common.k = CoOccurrence(users, num_items=5), 2
+
+    user_ids = t.tensor([2, 0, 3])
+    for matcher in [popular, common]:
+        # The per customer fallback of the base class
+        expected = Matcher.get_matches_batch(matcher, user_ids)
+        assert t.equal(matcher.get_matches_batch(user_ids), expected)
+
+    # Customer 3 has no co-purchasers, it gets no matches
+    assert common.get_matches_batch(user_ids).tolist() == [[2, 0, 0], [1, 2, 3]]
@@ -0,0 +1,38 @@
+import torch as t
+from dataclasses import replace
+from config import link_pred_config
+from data.neo4j.cache import NeighborhoodCache, neighborhood_cache_from_config
+
+
+def neighborhood(num_edges: int) -> dict:
+    return {("customer", "buys", "article"): t.zeros((2, num_edges), dtype=t.long)}
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = NeighborhoodCache(max_entries=2, max_bytes=1000)
+    cache.put((0, 2, 1, "train"), neighborhood(10))
+    cache.put((1, 2, 1, "train"), neighborhood(10))
+    # A hit makes 0 the most recently used, so 1 is evicted next
+    assert cache.get((0, 2, 1, "train")) is not None
+    cache.put((2, 2, 1, "train"), neighborhood(10))
+    assert cache.get((1, 2, 1, "train")) is None
+    assert cache.get((1, 2, 1, "val")) is None
+
+    # 2 * 60 * 8 bytes don't fit next to any of the 2 * 10 * 8 bytes entries
+    cache.put((3, 2, 1, "train"), neighborhood(60))
+    assert list(cache.entries.keys()) == [(3, 2, 1, "train")]
+    assert cache.stats() == dict(hits=1, misses=2, hit_rate=1 / 3, entries=1, bytes=960)
+
+
+def test_sampled_training_neighborhoods_are_not_cached():
+    config = replace(
+        link_pred_config, neighborhood_cache_entries=10, num_workers=0, num_neighbors=8
+    )
+    # A cached sample would be replayed every epoch
+    assert neighborhood_cache_from_config(config, train=True) is None
+    assert neighborhood_cache_from_config(config, train=False) is not None
+    # The whole n-hop neighborhood is the same every epoch
+    assert (
+        neighborhood_cache_from_config(replace(config, num_neighbors=-1), train=True)
+        is not None
+    )
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+import pytest
+from types import SimpleNamespace
+from data.neo4j.cache import NeighborhoodCache
+from data.neo4j.prefetch import AsyncPrefetchLoader
+
+
+class FakeDriver:
+    """Answers the id type query with `id_value`, and every neighborhood query with no records after `delay`"""
+
+    def __init__(self, id_value=0, delay: float = 0.01):
+        self.id_value = id_value
+        self.delay = delay
+        self.started = 0
+        self.running = 0
+        self.max_running = 0
+        self.loop = None
+        self.closed = False
+
+    def session(self, **kwargs):
+        return FakeSession(self)
+
+    async def close(self):
+        self.closed = True
+
+    async def run(self, query: str, parameters: dict):
+        if "RETURN n._id" in query:
+            return records([{"_id": self.id_value}])
+        self.started += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        return records([])
+
+
+class FakeSession:
+    def __init__(self, driver: FakeDriver):
+        self.driver = driver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def execute_read(self, read):
+        return await read(self.driver)
+
+
+async def records(rows: list):
+    for row in rows:
+        yield row
+
+
+class FakeDataset:
+    config = SimpleNamespace(n_hop_neighbors=2, neo4j_fetch_size=100)
+    split_type = "val"
+    num_neighbors = -1
+
+    def __init__(self, num_users: int, cache=None):
+        self.num_users = num_users
+        self.neighborhood_cache = cache
+
+    def __len__(self) -> int:
+        return self.num_users
+
+    def create_batch(self, user_ids: list, neighborhoods: dict) -> list:
+        assert sorted(neighborhoods) == sorted(user_ids)
+        return user_ids
+
+
+@pytest.fixture
+def driver(monkeypatch) -> FakeDriver:
+    driver = FakeDriver()
+
+    async def open_driver(self):
+        driver.loop = asyncio.get_running_loop()
+        return driver
+
+    monkeypatch.setattr(
+        AsyncPrefetchLoader, "_AsyncPrefetchLoader__open_driver", open_driver
+    )
+    return driver
+
+
+def test_batches_in_order_with_bounded_prefetch(driver):
+    cache = NeighborhoodCache(max_entries=100, max_bytes=10**6)
+    loader = AsyncPrefetchLoader(
+        FakeDataset(10, cache), batch_size=2, shuffle=False, in_flight=2
+    )
+    batches = []
+    for batch in loader:
+        batches.append(batch)
+        # A slow consumer: the loader never queries more than in_flight batches ahead of it
+        time.sleep(0.03)
+        assert driver.started <= len(batches) + 2
+    assert batches == [[0, 1], [2, 3], [4, 5], [6, 7], [8, 9]]
+    assert driver.max_running <= 2
+    assert len(cache.entries) == 10
+
+    # The second epoch is served from the cache
+    assert list(loader) == batches
+    assert driver.started == 5
+
+
+def test_early_break_stops_the_event_loop(driver):
+    threads = set(threading.enumerate())
+    for _ in AsyncPrefetchLoader(FakeDataset(20), batch_size=2, in_flight=3):
+        break
+    assert driver.closed
+    assert driver.loop.is_closed()
+    assert set(threading.enumerate()) == threads
+
+
+def test_string_ids_are_refused(driver):
+    driver.id_value = "0"
+    threads = set(threading.enumerate())
+    with pytest.raises(TypeError):
+        list(AsyncPrefetchLoader(FakeDataset(4), batch_size=2))
+    assert driver.started == 0
+    assert set(threading.enumerate()) == threads
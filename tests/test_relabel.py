@@ -0,0 +1,33 @@
+import torch as t
+from data.relabel import Relabeler
+
+buys, colours = ("customer", "buys", "article"), ("article", "has_color", "colour")
+
+
+def test_relabel_all_edge_types():
+    relabel = Relabeler({"customer": 10, "article": 20, "colour": 5})
+    subgraph = {buys: t.tensor([[7, 3, 7], [15, 2, 9]]), colours: t.tensor([[9], [4]])}
+    sampled = {buys: t.tensor([[3, 7], [19, 2]])}
+
+    node_ids, (local_subgraph, local_sampled) = relabel(subgraph, sampled)
+
+    assert node_ids["customer"].tolist() == [3, 7]
+    assert node_ids["article"].tolist() == [2, 9, 15, 19]
+    assert node_ids["colour"].tolist() == [4]
+    for edges, local_edges in [(subgraph, local_subgraph), (sampled, local_sampled)]:
+        for edge_type, edge_index in edges.items():
+            assert t.equal(
+                node_ids[edge_type[0]][local_edges[edge_type][0]], edge_index[0]
+            )
+            assert t.equal(
+                node_ids[edge_type[2]][local_edges[edge_type][1]], edge_index[1]
+            )
+
+    # The scratch index is reused, leftovers of the previous subgraph must not leak into the next one
+    node_ids, (local_subgraph, local_sampled) = relabel(
+        {buys: t.tensor([[7], [19]]), colours: t.empty(0)}, {buys: t.tensor([[7], [0]])}
+    )
+    assert node_ids["article"].tolist() == [0, 19]
+    assert node_ids["colour"].numel() == 0
+    assert local_subgraph[buys].tolist() == [[0], [1]]
+    assert local_sampled[buys].tolist() == [[0], [0]]
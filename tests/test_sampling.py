@@ -0,0 +1,58 @@
+import torch as t
+from data.adjacency import CSRAdjacency
+from data.sampling import AliasTable, sample_negative_edges, sample_negative_items
+
+num_items = 10
+edge_index = t.tensor(
+    [[0, 0, 0, 1, 2, 2, 2, 2, 2, 2, 2, 2, 2], [1, 4, 9, 0, 0, 1, 2, 3, 4, 5, 6, 7, 8]],
+    dtype=t.long,
+)
+users = CSRAdjacency.from_edge_index(edge_index, num_cols=num_items)
+
+
+def test_contains():
+    rows = t.tensor([0, 0, 0, 1, 1, 2, 2])
+    cols = t.tensor([4, 9, 5, 0, 9, 8, 9])
+    assert users.contains(rows, cols).tolist() == [1, 1, 0, 1, 0, 1, 0]
+
+
+def test_negative_edges_are_never_positive():
+    rows = t.tensor([0, 1, 2])
+    negatives = sample_negative_edges(users, rows, t.tensor([50, 50, 5]), num_items)
+
+    assert negatives.shape == (2, 105)
+    assert not users.contains(negatives[0], negatives[1]).any()
+    # The only article customer 2 hasn't bought is the last one
+    assert negatives[1, negatives[0] == 2].tolist() == [9] * 5
+
+
+def test_negative_items_from_full_row():
+    negatives = sample_negative_items(t.arange(num_items), num_items, 4)
+    assert negatives.numel() == 0
+
+    negatives = sample_negative_items(t.tensor([1, 4, 9]), num_items, 20)
+    assert negatives.numel() == 20
+    assert not t.isin(negatives, t.tensor([1, 4, 9])).any()
+
+
+def test_alias_table_follows_degrees():
+    degrees = t.tensor([0, 1, 2, 5, 0, 12])
+    alias_table = AliasTable.from_degrees(degrees, alpha=1.0)
+    samples = alias_table.sample(200_000)
+
+    frequencies = t.bincount(samples, minlength=6) / 200_000
+    assert frequencies[degrees == 0].sum() == 0
+    assert t.allclose(frequencies, degrees / degrees.sum(), atol=0.01)
+
+
+def test_saturated_rows_keep_the_item_weights():
+    degrees = t.tensor([1000, 1000, 1000, 1000, 1000, 1000, 1000, 1000, 0, 1])
+    alias_table = AliasTable.from_degrees(degrees, alpha=1.0)
+    # Article 8 has no purchases, it is never a negative, not even from the complement
+    negatives = sample_negative_items(t.arange(8), num_items, 20, alias_table)
+    assert negatives.tolist() == [9] * 20
+
+    negatives = sample_negative_items(
+        t.tensor([0, 1, 2, 3, 4, 5, 6, 7, 9]), num_items, 20, alias_table
+    )
+    assert negatives.numel() == 0
@@ -0,0 +1,33 @@
+import os
+import pandas as pd
+import pytest
+from data.neo4j.save import save_all_to_csv
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_csv_parts_are_written_in_parallel(tmp_path, monkeypatch, compress):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data/saved")
+    dataframes = {
+        "customers": pd.DataFrame({":ID(customer)": [0, 1], "age": [20, 30]}),
+        "transactions": pd.DataFrame(
+            {":START_ID(customer)": [0, 0, 1, 1, 0], ":TYPE": ["buys_TRAIN"] * 5}
+        ),
+    }
+    paths = save_all_to_csv(dataframes, compress, part_size=2, num_processes=2)
+
+    assert list(paths) == ["customers", "transactions"]
+    assert len(paths["transactions"].split(",")) == 4
+    for name, dataframe in dataframes.items():
+        # The header file followed by the parts, the way neo4j-admin import reads them
+        header, *parts = paths[name].split(",")
+        assert all(
+            path.endswith(".csv.gz" if compress else ".csv")
+            for path in [header, *parts]
+        )
+        columns = pd.read_csv(header).columns
+        read = pd.concat(
+            [pd.read_csv(part, header=None, names=columns) for part in parts],
+            ignore_index=True,
+        )
+        pd.testing.assert_frame_equal(read, dataframe)
@@ -6,12 +6,25 @@ from data.dataset_neo import GraphDataset as GraphDatasetNeo
 from torch import Tensor
 import torch as t
 import pandas as pd
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union
 from utils.types import NodeFeatures, ArticleFeatures, AllEdges, SampledEdges, Labels
 from run_preprocessing_fashion import save_to_neo4j
 
 
-def get_first_item_from_dataset(graph_database: bool) -> HeteroData:
+def get_first_item_from_dataset(
+    graph_database: bool, batched: bool = False
+) -> HeteroData:
+    train_dataset = get_dataset(graph_database)
+
+    if batched:
+        return train_dataset.sample_batch(t.tensor([0]))
+
+    return train_dataset[0]  # type: ignore
+
+
+def get_dataset(
+    graph_database: bool, neo4j_backend: str = "server"
+) -> Union[GraphDataset, GraphDatasetNeo]:
     data_dir = "data/derived/"
 
     config = Config(
@@ -47,6 +60,7 @@ def get_first_item_from_dataset(graph_database: bool) -> HeteroData:
             Constants.node_user,
             Constants.node_item,
         ],
+        neo4j_backend=neo4j_backend,
     )
 
     if graph_database:
@@ -70,7 +84,7 @@ def get_first_item_from_dataset(graph_database: bool) -> HeteroData:
             randomization=False,
         )
 
-    return train_dataset[0]  # type: ignore
+    return train_dataset
 
 
 def construct_heterodata(
@@ -4,6 +4,7 @@ import numpy as np
 from typing import Tuple, Optional
 import numpy as np
 from utils.constants import Constants
+from data.id_map import IdMap
 
 
 def create_data_pyg(
@@ -70,15 +71,12 @@ def create_data_dgl(
     return data
 
 
-def create_ids_and_maps(
-    df: pd.DataFrame, column: str, start: int
-) -> Tuple[pd.DataFrame, dict, dict]:
+def create_ids_and_maps(df: pd.DataFrame, column: str) -> Tuple[pd.DataFrame, IdMap]:
+    """Numbers the rows from 0 (in the index column), the id map holds the original id of every row"""
     df.reset_index(inplace=True)
-    df.index += start
-    mapping_forward = df[column].to_dict()
-    mapping_reverse = {v: k for k, v in mapping_forward.items()}
+    id_map = IdMap.from_values(df[column].to_numpy())
     df["index"] = df.index
-    return df, mapping_forward, mapping_reverse
+    return df, id_map
 
 
 def extract_edges(transactions: pd.DataFrame) -> dict: